@@ -52,40 +52,314 @@
 #                                                                         #
 ###########################################################################
 
+# Version of the JAMCODE library. Files compiled by JAMCODE (such as the dictionary
+# cache written by IMPORTDICT) are only reused by the same version.
+JAMCODE_VERSION='4.2'
+
+# Version of the tokenizer (LEXWORDS and NORMALIZE). The token cache (see OPENTOKENCACHE)
+# is only reused by the same version: it must be raised whenever a change of these
+# functions may split a text into different words.
+TOKENIZER_VERSION='1'
+
+# AMCAT_SERVER is the address of the AmCAT server from which the texts are obtained.
+AMCAT_SERVER='PLEASE ENTER ADDRESS OF AMCAT SERVER HERE'
+
 # GETTEXTS obtains a ordered list of text and metadata from the AmCAT server.
 # It requires the AmCAT library <amcat4py>, which defines the AmCAT API
 def gettexts(index,fromnr):
-	from amcat4py import AmcatClient
-	import html
 	texts=[]
-	conn=AmcatClient('PLEASE ENTER ADDRESS OF AMCAT SERVER HERE')
 	n=0
-	xid='id'
-	try: # On JAmCAT, some batches were uploaded using 'id' as identifiers, others with '_id'.
-		list(conn.query(index,fields=None))[0]['id']
-	except:
-		xid='_id'
-	for a in conn.query(index,fields=None): # retrieves all fields; if only specific known fields are needed, list them here
-		id=a[xid]
-		medium=a['medium']
-		date=a['date'].strftime("%Y-%m-%dT%H:%M:%S")
-		title=html.unescape(a['headline'].lower())
-		subtitle=''
-		if a['byline']:
-			subtitle=html.unescape(a['byline'].lower())
-		else:
-			subtitle=''
-		text=html.unescape(a['text'].lower())
-		article=[id,medium,date,title,subtitle,text]
-		if int(id)>=fromnr:
-			n=n+1
-			texts.append(article)
-			if n==500:
-				print('.', end=" ",flush=True)
-				n=0
+	for article in itertexts(index,fromnr):
+		n=n+1
+		texts.append(article)
+		if n==500:
+			print('.', end=" ",flush=True)
+			n=0
 	print(len(texts),'texts retrieved...')
 	return texts
 
+# ITERTEXTS obtains the same texts and metadata as GETTEXTS, but yields each article
+# as soon as it has been received from the AmCAT server. Coding can thus start with
+# the first article, and memory use does not grow with the size of the index.
+# The documents are obtained by FETCHTEXTS, such that the next pages are downloaded
+# while the articles received are coded.
+# The arguments skip, lastid and done are passed on to SELECTTEXTS.
+def itertexts(index,fromnr,skip=0,lastid=None,done=None):
+	for article in selecttexts(fetchtexts(index),fromnr,skip,lastid,done):
+		yield article
+
+# FETCHTEXTS yields all documents of an index on the AmCAT server with all fields, as
+# the query of the AmCAT API does. The pages of documents are requested by a separate
+# thread (see FETCHPAGES), which keeps up to <prefetch> pages ready while the documents
+# received before are processed.
+def fetchtexts(index,per_page=200,prefetch=4,retries=5):
+	import threading
+	import queue
+	from amcat4py import AmcatClient
+	conn=AmcatClient(AMCAT_SERVER)
+	pages=queue.Queue(prefetch)
+	stop=threading.Event()
+	fetcher=threading.Thread(target=fetchpages,args=(conn,index,per_page,retries,pages,stop),daemon=True)
+	fetcher.start()
+	try:
+		while True:
+			page=pages.get()
+			if page==None:	#ALL PAGES RECEIVED
+				break
+			if isinstance(page,Exception):
+				raise page
+			for a in page:
+				yield a
+	finally:
+		stop.set()	#ALSO STOPS THE THREAD IF NOT ALL DOCUMENTS ARE NEEDED
+		fetcher.join()
+
+# FETCHPAGES requests the pages of documents from the AmCAT server one after another
+# using the scroll cursor of the AmCAT API, over one connection that is kept open, and
+# puts them into the queue <pages>, followed by None once all pages have been received,
+# or by the error that prevented this. It stops when the event <stop> is set.
+# Failed requests (no connection, server busy or errors of the server, see FETCHPAGE)
+# are repeated up to <retries> times in a row, waiting 1, 2, 4, ... seconds in between.
+# As the server may have moved the scroll cursor on before a request failed, the scroll
+# is then started anew, and the documents received before are passed over; the last
+# of them must be the same document as before. Once the scroll has ended, the number of
+# documents received is checked against the number of documents in the index.
+def fetchpages(conn,index,per_page,retries,pages,stop):
+	import datetime
+	import queue
+	import time
+	import requests
+	session=requests.Session()
+	body={'scroll':'2m','per_page':per_page}
+	received=0	#NUMBER OF DOCUMENTS PUT INTO THE QUEUE
+	lastid=None	#ID OF THE LAST OF THEM
+	skip=0	#NUMBER OF DOCUMENTS TO PASS OVER AFTER THE SCROLL WAS STARTED ANEW
+	failures=0
+	total=None
+	try:
+		while not stop.is_set():
+			try:
+				d=fetchpage(session,conn,index,body)
+			except ConnectionError:
+				failures=failures+1
+				if failures>retries:
+					raise
+				time.sleep(2**(failures-1))
+				if 'scroll_id' in body:
+					del body['scroll_id']
+					skip=received
+				continue
+			failures=0
+			if d==None or len(d['results'])==0:
+				break
+			total=d['meta'].get('total_count',total)
+			body['scroll_id']=d['meta']['scroll_id']
+			item=[]
+			for a in d['results']:
+				if skip>0:
+					skip=skip-1
+					if skip==0 and str(a.get('id',a.get('_id')))!=lastid:
+						raise IOError('the AmCAT server returned the documents in a different order after the scroll was started anew')
+					continue
+				if a.get('date'):
+					if conn.ignore_tz:
+						a['date']=datetime.datetime.fromisoformat(a['date'][:10])
+					else:
+						a['date']=datetime.datetime.fromisoformat(a['date'])
+				item.append(a)
+			if len(item)==0:
+				continue
+			received=received+len(item)
+			lastid=str(item[-1].get('id',item[-1].get('_id')))
+			while not stop.is_set():
+				try:
+					pages.put(item,timeout=1)
+					break
+				except queue.Full:
+					continue
+		if not stop.is_set() and total!=None and received<int(total):
+			raise IOError('only '+str(received)+' of '+str(total)+' documents were received from the AmCAT server')
+		item=None
+	except Exception as e:
+		item=e
+	finally:
+		session.close()
+	while not stop.is_set():
+		try:
+			pages.put(item,timeout=1)
+			break
+		except queue.Full:
+			continue
+
+# FETCHPAGE sends one query to the AmCAT server, and returns the response of the AmCAT
+# API, or None at the end of the scroll cursor. If the request failed because there is
+# no connection, the server is busy or an error occurred on the server, it raises a
+# ConnectionError, so the request can be repeated (see FETCHPAGES).
+def fetchpage(session,conn,index,body):
+	import json
+	import requests
+	url,headers=amcatquery(conn,index)
+	try:
+		r=session.post(url,data=json.dumps(body),headers=headers,timeout=300)
+	except (requests.ConnectionError,requests.Timeout) as e:
+		raise ConnectionError(str(e))
+	if r.status_code==404:
+		return None
+	if r.status_code==429 or r.status_code>=500:
+		raise ConnectionError('AmCAT server returned status '+str(r.status_code))
+	r.raise_for_status()
+	return r.json()
+
+# AMCATQUERY returns the address of the query of an index on the AmCAT server, and the
+# headers that authenticate a request with the login of the AmCAT client conn (whose
+# token is renewed if needed). The AmCAT library <amcat4py> does not make these
+# public, so this is the only function that depends on its internals.
+def amcatquery(conn,index):
+	headers={'Content-Type':'application/json'}
+	if conn.api_key!=None:
+		headers['X-API-Key']=conn.api_key
+	elif conn.token!=None:
+		from amcat4py.auth import _check_token
+		conn.token=_check_token(conn.token,conn.host)
+		headers['Authorization']='Bearer '+conn.token['access_token']
+	return [conn._url('query',index),headers]
+
+# SELECTTEXTS turns the documents obtained from the AmCAT server or from a file into
+# articles (see MAKEARTICLE), starting from the first with an id of at least fromnr.
+# To resume an interrupted run, the first <skip> articles are passed over without
+# being processed; the last of them must be the article with the id <lastid>, or
+# else the texts are returned in a different order than before. Articles whose
+# id is in the set <done> are passed over as well, and not counted.
+def selecttexts(docs,fromnr,skip=0,lastid=None,done=None):
+	xid=None
+	for a in docs:
+		if xid==None: # On JAmCAT, some batches were uploaded using 'id' as identifiers, others with '_id'.
+			if 'id' in a:
+				xid='id'
+			else:
+				xid='_id'
+		if int(a[xid])<fromnr:
+			continue
+		if done!=None and str(a[xid]) in done:
+			continue
+		if skip>0:
+			skip=skip-1
+			if skip==0 and lastid!=None and str(a[xid])!=str(lastid):
+				raise ValueError('cannot resume: document '+str(a[xid])+' found where '+str(lastid)+' was coded last')
+			continue
+		yield makearticle(a,xid)
+
+# ITERFILE obtains the same texts and metadata as ITERTEXTS from a file instead of the
+# AmCAT server, such as an export of an index. The file is read one document at a
+# time, and can be
+# - a JSON lines file (.jsonl, .ndjson or .json), with one document per line
+# - a CSV file (.csv) with a header line
+# - a Parquet file (.parquet), which requires the library <pyarrow>
+# Each document has the same fields as on the AmCAT server ('id' or '_id', 'medium',
+# 'date', 'headline', 'byline', 'text'); missing fields are left empty, except for the
+# date, which is required. Dates are written in ISO format (e.g., 2015-03-01T12:00:00).
+# A document without a valid date raises a ValueError naming the file and the line
+# (or row, in a Parquet file).
+def iterfile(filename,fromnr,skip=0,lastid=None,done=None):
+	for article in selecttexts(readfile(filename),fromnr,skip,lastid,done):
+		yield article
+
+# READFILE yields the documents in a file read by ITERFILE.
+def readfile(filename):
+	import csv, json
+	extension=filename.lower().rsplit('.',1)[-1]
+	if extension in ['jsonl','ndjson','json']:
+		fi=open(filename,encoding='utf-8')
+		n=0
+		for line in fi:
+			n=n+1
+			if line.strip()!='':
+				yield filedoc(json.loads(line),filename+', line '+str(n))
+		fi.close()
+	elif extension=='csv':
+		fi=open(filename,encoding='utf-8',newline='')
+		reader=csv.DictReader(fi)
+		for a in reader:
+			yield filedoc(a,filename+', line '+str(reader.line_num))
+		fi.close()
+	elif extension=='parquet':
+		import pyarrow.parquet
+		n=0
+		for batch in pyarrow.parquet.ParquetFile(filename).iter_batches(batch_size=1000):
+			for a in batch.to_pylist():
+				n=n+1
+				yield filedoc(a,filename+', row '+str(n))
+	else:
+		raise ValueError('unknown file type: '+filename)
+
+# FILEDOC completes a document read from a file like a document obtained from the AmCAT
+# server. Like the AmCAT API (which ignores time zones by default), it only keeps the
+# day of the date, such that a file is coded like the index it was exported from.
+# where names the position of the document in the file for error messages.
+def filedoc(a,where):
+	import datetime
+	for field in ['medium','headline','byline','text']:
+		if a.get(field)==None:
+			a[field]=''
+	date=a.get('date')
+	if date==None or (isinstance(date,str) and date.strip()==''):
+		raise ValueError('document without a date in '+where)
+	if isinstance(date,str):
+		try:
+			a['date']=datetime.datetime.fromisoformat(date.strip()[:10])
+		except ValueError:
+			raise ValueError('invalid date "'+date+'" in '+where)
+	else:
+		a['date']=datetime.datetime(date.year,date.month,date.day)
+	return a
+
+# COUNTFILE returns the number of documents in a file read by ITERFILE, or None if it
+# cannot be determined without parsing the file (CSV files).
+def countfile(filename):
+	extension=filename.lower().rsplit('.',1)[-1]
+	if extension in ['jsonl','ndjson','json']:
+		n=0
+		fi=open(filename,'rb')
+		for line in fi:
+			if line.strip()!=b'':
+				n=n+1
+		fi.close()
+		return n
+	elif extension=='parquet':
+		import pyarrow.parquet
+		return pyarrow.parquet.ParquetFile(filename).metadata.num_rows
+	return None
+
+# MAKEARTICLE turns a document obtained from the AmCAT server into the list
+# [<id>, <medium>, <date>, <title>, <subtitle>, <text>] used by the coding script.
+def makearticle(a,xid):
+	import html
+	id=a[xid]
+	medium=a['medium']
+	date=a['date'].strftime("%Y-%m-%dT%H:%M:%S")
+	title=html.unescape(a['headline'].lower())
+	subtitle=''
+	if a['byline']:
+		subtitle=html.unescape(a['byline'].lower())
+	else:
+		subtitle=''
+	text=html.unescape(a['text'].lower())
+	return [id,medium,date,title,subtitle,text]
+
+# COUNTTEXTS returns the number of texts in an index on the AmCAT server, without
+# retrieving them, or None if the server does not report it.
+def counttexts(index):
+	from amcat4py import AmcatClient
+	import requests
+	conn=AmcatClient(AMCAT_SERVER)
+	session=requests.Session()
+	try:
+		return int(fetchpage(session,conn,index,{'per_page':1,'fields':['_id']})['meta']['total_count'])
+	except Exception:
+		return None
+	finally:
+		session.close()
+
 # IMPORTDICT imports a dictionary file named DICT_<name>.txt, using the JAMCODE Query Syntax:
 # Every line defines a separate query, which is structured as follows:
 # <concept id>	<concept name>	<time range>	<search phrases>
@@ -111,8 +385,8 @@ def gettexts(index,fromnr):
 #     <words>      can be one word (which can be truncated again) or multiple words
 #                  separated by & (AND) or | (OR). For complex queries, rounded brackets
 #                  organize the Boolean query. Within one bracket, only one kind of
-#                  operator is allowed. Brackets must contain more than one word. The
-#                  current code supports only up to five levels of nested brackets.
+#                  operator is allowed. Brackets must contain more than one word.
+#                  Brackets can be nested to any depth.
 #                  EXAMPLES:
 #                  _y(*foo~5) is satisfied if a word ending with 'foo' is found within 5 words distance
 #                  _y(foo&*bar~10) is satisfied if the word 'foo' and a word ending with 'bar' must be found within 10 words distance
@@ -163,11 +437,22 @@ def gettexts(index,fromnr):
 # _p(<characters>) specifies character sequences that are NOT permitted as prefixes,
 #                  even if they are generally permitted.
 #
-def importdict(dictionary):
+# CACHING
+# The parsed dictionary is stored in the folder 'jamcode_cache', under the content hash
+# of the dictionary file and the version of JAMCODE. As long as neither changes,
+# IMPORTDICT loads the stored dictionary instead of parsing the file again.
+# Set cache=0 to always parse the dictionary file.
+#
+def importdict(dictionary,cache=1):
 	import codecs
 	import re
 	import datetime
 	dict_file='DICT_'+dictionary+'.txt'
+	if cache==1:
+		dict=loaddictcache(dict_file)
+		if dict!=None:
+			print(len(dict), 'codephrases read from cache...')
+			return dict
 	if len(dictionary)>2:
 		language=dictionary[-2:]
 	di=codecs.open(dict_file,encoding='utf-8')
@@ -185,23 +470,17 @@ def importdict(dictionary):
 			timeto=time[1].split('/')
 			timeto=datetime.date(int('20'+timeto[2]),int(timeto[1]),int(timeto[0])).isoformat()
 			time=[timefrom,timeto]
-		if language=='MA': # brings all spellings into one character space
-			searchphrase=re.sub(r'c(?!h)','ts',searchphrase)
-			searchphrase=searchphrase.replace('č','ch').replace('dzh','dj').replace('ẑ','dz').replace('ž','zh').replace('ǵ','gj').replace('đ','gj').replace('ǰ','j').replace('ḱ','kj').replace('ć','kj').replace('dž','dj').replace('š','sh')
-			searchphrase=searchphrase.replace('а','a').replace('б','b').replace('в','v').replace('г','g').replace('д','d').replace('ѓ','gj').replace('е','e').replace('ж','zh').replace('з','z').replace('ѕ','dz').replace('и','i').replace('ј','j').replace('к','k').replace('л','l').replace('љ','lj').replace('м','m').replace('н','n').replace('њ','nj').replace('о','o').replace('п','p').replace('р','r').replace('с','s').replace('т','t').replace('ќ','kj').replace('у','u').replace('ф','f').replace('х','h').replace('ц','ts').replace('ч','ch').replace('џ','dj').replace('ш','sh')
-		elif language=='SR': # brings all spellings into one character space
-			searchphrase=re.sub(r'c(?!h)','ts',searchphrase)
-			searchphrase=searchphrase.replace('č','ch').replace('ž','zh').replace('ć','kj').replace('đ','dj').replace('dž','dj').replace('š','sh')
-			searchphrase=searchphrase.replace('а','a').replace('б','b').replace('в','v').replace('г','g').replace('д','d').replace('ђ','gj').replace('е','e').replace('ж','zh').replace('з','z').replace('и','i').replace('ј','j').replace('к','k').replace('л','l').replace('љ','lj').replace('м','m').replace('н','n').replace('њ','nj').replace('о','o').replace('п','p').replace('р','r').replace('с','s').replace('т','t').replace('ћ','kj').replace('у','u').replace('ф','f').replace('х','h').replace('ц','ts').replace('ч','č').replace('џ','dj').replace('ш','sh')
+		if language=='MA' or language=='SR': # brings all spellings into one character space
+			searchphrase=transliterate(searchphrase,language)[0]
 		elif language=='FR': # does NOT strip special characters and accents
-			searchphrase=searchphrase.lower().replace('œ','oe').replace('æ','ae').replace('ï','i').replace('ü','u').replace('ÿ','y')
+			searchphrase=searchphrase.lower().translate(TABLE_FR)
 		elif language=='AL': # strips special characters and accents
 			searchphrase=searchphrase.replace('ë','e#')
 			searchphrase=searchphrase.replace('e#','ë')
-		elif language=='AR' or language=='HE':
-			searchphrase=searchphrase.replace('\"','"').replace('\'','"').replace('أ','ا').replace('إ','ا').replace('آ','اا')
-			if language=='AR':
-				searchphrase=searchphrase.replace('١','1').replace('٢','2').replace('٣','3').replace('٤','4').replace('٥','5').replace('٦','6').replace('٧','7').replace('٨','8').replace('٩','9').replace('٠','0')
+		elif language=='AR':
+			searchphrase=searchphrase.translate(TABLE_QUERY_AR)
+		elif language=='HE':
+			searchphrase=searchphrase.translate(TABLE_QUERY_HE)
 		searchphrase=searchphrase.lower()
 		searchphrase=searchphrase.replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' ').replace('  ',' ')
 		queries=searchphrase.strip().split(' ')
@@ -295,7 +574,7 @@ def importdict(dictionary):
 								else:
 									el[e][f+1]=' '+el[e][f+1]+' '
 									el[e][f+1]=el[e][f+1].replace('* ','').replace(' *','')
-						criterion=[yes,d,el.pop()]
+						criterion=(yes,d,compilecrit(el.pop()))
 						cr.append(criterion)
 			if not time=='':
 				dict.append([id,name,kw,time,cr,[notpref,notsuf]])
@@ -305,7 +584,7 @@ def importdict(dictionary):
 				dict.append([id,name,kw,[],cr,[notpref,notsuf]])
 	'''
 	DICT STRUCTURE:
-	[<concept id>, <concept name>, <keyword>, <time>, [([<presence/absence1>, <distance1>, [criterion1]], [<presence/absence2>, <distance2>, [criterion2]]...)]]
+	[<concept id>, <concept name>, <keyword>, <time>, [(<presence/absence1>, <distance1>, (criterion1)), (<presence/absence2>, <distance2>, (criterion2))...]]
 	concept id		:	dict[0]
 	concept name	:	dict[1]
 	keyword			:	dict[2]
@@ -319,8 +598,371 @@ def importdict(dictionary):
 	'''
 	di.close()
 	print(len(dict), 'codephrases read in successfully...')
+	if cache==1:
+		savedictcache(dict_file,dict)
 	return dict
 
+# DICTHASH returns a hash of the content of a dictionary file and the version of
+# JAMCODE, which changes whenever the coding of a text with the dictionary may change.
+def dicthash(dict_file):
+	import hashlib
+	h=hashlib.sha256(JAMCODE_VERSION.encode('utf-8')+b'\n')
+	with open(dict_file,'rb') as df:
+		h.update(df.read())
+	return h.hexdigest()[:16]
+
+# DICTCACHEFILE returns the name of the cache file for a dictionary file, which is
+# specific to the content of the dictionary file and the version of JAMCODE.
+def dictcachefile(dict_file):
+	import os
+	return os.path.join('jamcode_cache',dict_file[:-4]+'.'+dicthash(dict_file)+'.pickle')
+
+# LOADDICTCACHE returns the cached dictionary for a dictionary file, or None if there
+# is no valid cache file for the current content of the dictionary file.
+def loaddictcache(dict_file):
+	import pickle
+	import os
+	cache_file=dictcachefile(dict_file)
+	if not os.path.exists(cache_file):
+		return None
+	try:
+		with open(cache_file,'rb') as cf:
+			return pickle.load(cf)
+	except Exception:
+		return None
+
+# SAVEDICTCACHE stores a parsed dictionary in the cache, and removes cache files of
+# earlier versions of the same dictionary file. Several runs may do so at the same
+# time: each writes its own temporary file, and a cache file that cannot be written
+# is only reported, as the dictionary is then simply parsed again by the next run.
+def savedictcache(dict_file,dict):
+	import pickle
+	import os
+	import glob
+	import tempfile
+	cache_file=dictcachefile(dict_file)
+	tmp=None
+	try:
+		os.makedirs('jamcode_cache',exist_ok=True)
+		for old in glob.glob(os.path.join('jamcode_cache',glob.escape(dict_file[:-4])+'.*.pickle')):
+			if old!=cache_file:
+				try:
+					os.remove(old)
+				except FileNotFoundError:	#REMOVED BY ANOTHER RUN
+					pass
+		fd,tmp=tempfile.mkstemp(dir='jamcode_cache',suffix='.tmp')
+		with os.fdopen(fd,'wb') as cf:
+			pickle.dump(dict,cf,protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp,cache_file)
+	except OSError as e:
+		print('the dictionary could not be cached:',e)
+		if tmp!=None and os.path.exists(tmp):
+			os.remove(tmp)
+
+# COMPILECRIT turns the nested lists of a parsed Boolean criterion into an immutable
+# tree of tuples, so it can be evaluated any number of times without being copied.
+# Each bracket becomes a tuple (<operator>, <element1>, <element2>, ...), where
+# <operator> is 0 for OR and 1 for AND, and each element is either a search term
+# or another bracket.
+def compilecrit(el):
+	tree=[el[0]]
+	for e in el[1:]:
+		if isinstance(e,str):
+			tree.append(e)
+		else:
+			tree.append(compilecrit(e))
+	return tuple(tree)
+
+# EVALCRIT evaluates a Boolean criterion compiled by COMPILECRIT. test is a function
+# that states whether a single search term is found. OR brackets are satisfied by the
+# first matched element and AND brackets fail on the first unmatched element, so the
+# remaining elements are not tested. Returns 1 if the criterion is matched, else 0.
+def evalcrit(tree,test):
+	for e in tree[1:]:
+		if isinstance(e,str):
+			ok=test(e)
+		else:
+			ok=evalcrit(e,test)
+		if ok and tree[0]==0:
+			return 1
+		if not ok and tree[0]==1:
+			return 0
+	return tree[0]
+
+# INDEXDICT compiles the list of queries obtained from IMPORTDICT into a lookup index,
+# so that JCODE only needs to test those queries whose keyword can actually match a
+# given word, instead of testing every query in the dictionary against every word.
+# The index is built once after IMPORTDICT and passed on to JCODE or JCODE_HA.
+# Queries are sorted by the truncation of their keyword:
+# - keywords without truncation (foo) are stored in a hash map. As JCODE also accepts
+#   the plural form of such keywords, they are stored under 'foo' and 'foos'.
+# - keywords truncated at the end (foo*) are stored in a prefix trie.
+# - keywords truncated at the beginning (*foo) are stored in a trie of reversed
+#   keywords, again together with their plural form.
+# - keywords truncated at both ends (*foo*) are compiled into an Aho-Corasick automaton
+#   (see ACBUILD), which reports all such keywords contained in a word in one pass.
+# - keywords that fit none of these (e.g., an empty keyword) are tested against every word.
+# In Arabic ('AR') and Hebrew ('HE'), JCODE_HA permits prefixes and suffixes around every
+# keyword, so all keywords are compiled into the automaton.
+# Each entry refers to the position of the query within the dictionary list, so queries
+# are still tested in the order of the dictionary.
+# The index also holds the vocabulary of the coded texts (see NEWVOCABULARY), and for
+# each word of the vocabulary, the queries whose keyword matches it (see KEYWORDIDS).
+def indexdict(dict,lang=''):
+	index={'exact':{},'prefix':{},'suffix':{},'infix':None,'scan':[]}
+	infix=[]
+	for i in range(len(dict)):
+		kw=dict[i][2]
+		body=kw.strip(' ')
+		if body=='' or ' ' in body:
+			index['scan'].append(i)
+		elif lang=='AR' or lang=='HE':
+			infix.append([body,i])
+		elif kw==' '+body+' ':
+			index['exact'].setdefault(body,[]).append(i)
+			index['exact'].setdefault(body+'s',[]).append(i)
+		elif kw==' '+body:
+			trieadd(index['prefix'],body,i)
+		elif kw==body+' ':
+			trieadd(index['suffix'],body[::-1],i)
+			trieadd(index['suffix'],('s'+body[::-1]),i)
+		elif kw==body:
+			infix.append([body,i])
+		else:
+			index['scan'].append(i)
+	index['infix']=acbuild(infix)
+	index['timed']=[i for i in range(len(dict)) if dict[i][3]!=[]]
+	index['dates']=None
+	index['vocab']=newvocabulary()
+	index['keywords']=[]
+	return index
+
+# TRIEADD adds the query position i to a trie (nested dictionaries of characters)
+# under the string key. The query positions of a node are listed under ''.
+def trieadd(trie,key,i):
+	node=trie
+	for ch in key:
+		node=node.setdefault(ch,{})
+	node.setdefault('',[]).append(i)
+
+# ACBUILD compiles a list of [<string>, <query position>] pairs into an Aho-Corasick
+# automaton: a trie of all strings (goto), whose states are linked to the state of
+# their longest proper suffix (fail). Each state lists the query positions of all strings
+# ending in that state (out), including those inherited through its fail link.
+# ACSCAN then finds all strings contained in a word by reading it once.
+def acbuild(patterns):
+	goto=[{}]
+	out=[[]]
+	for pat,i in patterns:
+		s=0
+		for ch in pat:
+			if not ch in goto[s]:
+				goto.append({})
+				out.append([])
+				goto[s][ch]=len(goto)-1
+			s=goto[s][ch]
+		out[s].append(i)
+	fail=[0]*len(goto)
+	queue=list(goto[0].values())
+	for s in queue:
+		for ch,u in goto[s].items():
+			queue.append(u)
+			f=fail[s]
+			while f>0 and not ch in goto[f]:
+				f=fail[f]
+			if ch in goto[f]:
+				fail[u]=goto[f][ch]
+			out[u]=out[u]+out[fail[u]]
+	return [goto,fail,out]
+
+# ACSCAN adds the query positions of all strings of the automaton obtained from ACBUILD
+# which are contained in the word to the set hits.
+def acscan(automaton,word,hits):
+	goto,fail,out=automaton
+	s=0
+	for ch in word:
+		while s>0 and not ch in goto[s]:
+			s=fail[s]
+		s=goto[s].get(ch,0)
+		if out[s]:
+			hits.update(out[s])
+
+# INRANGE tests whether a document date lies within the time range of a query
+# ([<from date>, <to date>], or [] if the query applies to all documents).
+# Time ranges in the year 2099 recur annually: they are applied to the year of the
+# document, or, if they span the turn of the year, to the previous or following year.
+def inrange(time,date):
+	if time==[]:
+		return 1
+	fromdate=time[0]
+	todate=time[1]
+	if '2099' in time[0]:
+		if time[0]<time[1]:
+			fromdate=date[:4]+time[0][4:]
+			todate=date[:4]+time[1][4:]
+		elif date[:4]+time[0][4:]>date:
+			fromdate=str(int(date[:4])-1)+time[0][4:]
+			todate=date[:4]+time[1][4:]
+		else:
+			fromdate=date[:4]+time[0][4:]
+			todate=str(int(date[:4])+1)+time[1][4:]
+	if fromdate<=date<=todate:
+		return 1
+	return 0
+
+# ACTIVEQUERIES returns a bytearray flagging which queries of the dictionary are active
+# for a document date, so that JCODE never tests queries outside their time range.
+# Returns None if no query has a time range.
+# As all time ranges are dates of ten characters (yyyy-mm-dd), comparing them with the
+# document date only depends on its first eleven characters (i.e., the day and whether
+# a time follows). The result is therefore cached per day in the index obtained from
+# INDEXDICT, keeping the most recently used days.
+def activequeries(dict,index,date):
+	from collections import OrderedDict
+	if index['timed']==[]:
+		return None
+	if index['dates']==None:
+		index['dates']=OrderedDict()
+	day=date[:11]
+	if day in index['dates']:
+		index['dates'].move_to_end(day)
+		return index['dates'][day]
+	active=bytearray(b'\x01')*len(dict)
+	for i in index['timed']:
+		active[i]=inrange(dict[i][3],day)
+	index['dates'][day]=active
+	if len(index['dates'])>256:
+		index['dates'].popitem(last=False)
+	return active
+
+# LOOKUPWORD returns the ordered positions of all queries in the index obtained from
+# INDEXDICT whose keyword may match the word. If active (obtained from ACTIVEQUERIES)
+# is given, only the active queries are returned.
+def lookupword(index,word,active=None):
+	hits=set(index['scan'])
+	if word in index['exact']:
+		hits.update(index['exact'][word])
+	for trie,key in ((index['prefix'],word),(index['suffix'],word[::-1])):
+		node=trie
+		for ch in key:
+			node=node.get(ch)
+			if node==None:
+				break
+			if '' in node:
+				hits.update(node[''])
+	acscan(index['infix'],word,hits)
+	if active!=None:
+		return sorted([i for i in hits if active[i]])
+	return sorted(hits)
+
+import re
+
+# NORMALIZATION TABLES
+# TOWORDS and IMPORTDICT bring all spellings of a language into one character space.
+# Replacements of single characters are compiled once into translation tables, which
+# str.translate applies in a single pass; regular expressions are compiled once as well.
+# RE_LEX recognizes words and the syntax that TOWORDS replaces by words (see LEXWORDS).
+# MARKERWORDS lists all words that replace syntax, which JCODE never codes.
+LATIN_MA={'č':'ch','ẑ':'dz','ž':'zh','ǵ':'gj','đ':'gj','ǰ':'j','ḱ':'kj','ć':'kj','š':'sh'}
+CYRILLIC_MA={'а':'a','б':'b','в':'v','г':'g','д':'d','ѓ':'gj','е':'e','ж':'zh','з':'z','ѕ':'dz','и':'i','ј':'j','к':'k','л':'l','љ':'lj','м':'m','н':'n','њ':'nj','о':'o','п':'p','р':'r','с':'s','т':'t','ќ':'kj','у':'u','ф':'f','х':'h','ц':'ts','ч':'ch','џ':'dj','ш':'sh'}
+LATIN_SR={'č':'ch','ž':'zh','ć':'kj','đ':'dj','š':'sh'}
+CYRILLIC_SR={'а':'a','б':'b','в':'v','г':'g','д':'d','ђ':'gj','е':'e','ж':'zh','з':'z','и':'i','ј':'j','к':'k','л':'l','љ':'lj','м':'m','н':'n','њ':'nj','о':'o','п':'p','р':'r','с':'s','т':'t','ћ':'kj','у':'u','ф':'f','х':'h','ц':'ts','ч':'č','џ':'dj','ш':'sh'}
+ARABIC_DIGITS={'٠':'0','١':'1','٢':'2','٣':'3','٤':'4','٥':'5','٦':'6','٧':'7','٨':'8','٩':'9'}
+ARABIC_ALEF={'إ':'ا','أ':'ا','آ':'اا'}
+ARABIC={'ـ':'','ס':'','؛':'','ً':'','ٌ':'','ٍ':'','َ':'','ُ':'','ِ':'','ّ':'','ْ':'','ی':'ى','پ':'ب','چ':'غ','ڤ':'و','گ':'ج','ۆ':'و'}
+FRENCH={'œ':'oe','æ':'ae','ï':'i','ü':'u','ÿ':'y'}
+APOSTROPHES={'’':"'",'‘':"'",'´':"'",'`':"'"}
+QUOTES={'“':'"','”':'"','«':'"','»':'"'}
+SPACED={c:' '+c+' ' for c in '%$€&@#*()[]{}'}
+MARKERS={'\n':['xxpar','xxx','xxx','xxx','xxx'],"'":['xxapo'],'-':['xxdash'],'.':['xxdot','xxx','xxx'],'!':['xxexc','xxx','xxx'],'?':['xxque','xxx','xxx'],',':['xxcom'],':':['xxcol'],';':['xxsem']}
+MARKERWORDS=['xxpar','xxx','xxapo','xxdash','xxdot','xxexc','xxque','xxcom','xxcol','xxsem','xxcolpar','xxlqu','xxrqu']
+PUNCTUATION={'.':0,'!':1,'?':2,',':3,':':4,';':5}
+TABLE_MA=str.maketrans({**LATIN_MA,**CYRILLIC_MA})
+TABLE_SR=str.maketrans({**LATIN_SR,**CYRILLIC_SR})
+TABLE_AR=str.maketrans({**ARABIC,**ARABIC_DIGITS,**ARABIC_ALEF})
+TABLE_FR=str.maketrans(FRENCH)
+TABLE_PUNCT=str.maketrans({**APOSTROPHES,**QUOTES,**SPACED})
+TABLE_QUERY_AR=str.maketrans({"'":'"',**ARABIC_ALEF,**ARABIC_DIGITS})
+TABLE_QUERY_HE=str.maketrans({"'":'"',**ARABIC_ALEF})
+RE_CTS=re.compile(r'c(?!h)')
+RE_ACRONYM_AR=re.compile(r'(?<=\w)[\'\"](?=\w)')
+RE_ACRONYM_HE=re.compile(r'(?<=\w)[\'\"]+(?=\w)')
+RE_GENITIVE=re.compile(r"'s ")
+RE_INWORD_APO=re.compile(r"(?<=\w)'(?=\w)")
+RE_LEX=re.compile(r'''(?P<s>[^\s.!?,:;"'\-]+ (?![\s.!?,:;"'\-]|xxpar))|(?P<c>[^\s.!?,:;"'\-]+)|(?P<n>[\n ]+)|(?P<w>[^\S\n ]+)|(?P<b>[.!?,:;]+(?=[ \n'\-]|"(?:[\s.!?:;,]|\Z)|\Z))|(?P<p>[.!?,:;]+)|(?P<l>(?:(?<=\s)|\A)"(?=\w))|(?P<r>(?<=[\w.!?:;,])"(?=[\s.!?:;,]|\Z))|(?P<q>")|(?P<a>')|(?P<d>-)''')
+
+# REWRITE applies one cleanup step to a text: a str.translate table (if repl is None),
+# a str.replace of the string find by repl, or the substitution of a compiled regular
+# expression find by repl. If origin is a list stating, for each character of the text,
+# its position in the raw text, it returns the list for the rewritten text as well.
+def rewrite(text,origin,find,repl=None):
+	if repl==None:
+		new=text.translate(find)
+		if origin==None:
+			return [new,None]
+		edits=''.join([chr(k) for k in find if len(find[k])!=1])
+		if edits=='':
+			return [new,origin]
+		edits=re.compile('['+re.escape(edits)+']')
+	elif type(find)==str:
+		new=text.replace(find,repl)
+		if origin==None:
+			return [new,None]
+		edits=re.compile(re.escape(find))
+	else:
+		new=find.sub(repl,text)
+		if origin==None:
+			return [new,None]
+		edits=find
+	neworigin=[]
+	last=0
+	for m in edits.finditer(text):
+		start,end=m.span()
+		neworigin.extend(origin[last:start])
+		if repl==None:
+			neworigin.extend([origin[start]]*len(find[ord(m.group())]))
+		else:
+			neworigin.extend([origin[start]]*len(repl))
+		last=end
+	neworigin.extend(origin[last:])
+	return [new,neworigin]
+
+# TRANSLITERATE brings Macedonian ('MA') or Serbian ('SR') text, written in Cyrillic
+# or Roman characters, into one Roman character space. It returns [<text>, <origin>],
+# where origin is None unless given (see REWRITE).
+def transliterate(text,language,origin=None):
+	text,origin=rewrite(text,origin,RE_CTS,'ts')
+	if language=='MA':
+		text,origin=rewrite(text,origin,'dzh','dj')
+		return rewrite(text,origin,TABLE_MA)
+	return rewrite(text,origin,TABLE_SR)
+
+# NORMALIZE cleans up the special characters of a lowercase text, depending on the
+# language (see TOWORDS), and returns [<text>, <origin>] (see REWRITE).
+def normalize(text,language,origin=None):
+	text,origin=rewrite(text,origin,'« ','"')
+	text,origin=rewrite(text,origin,' »','"')
+	text,origin=rewrite(text,origin,TABLE_PUNCT)
+	for i in range(3):
+		text,origin=rewrite(text,origin,'  ',' ')
+	if origin!=None:
+		origin=origin[len(text)-len(text.lstrip()):len(text.rstrip())]
+	text=text.strip()
+	if language=='AR': # brings all spellings into one character space
+		text,origin=rewrite(text,origin,TABLE_AR)
+		text,origin=rewrite(text,origin,RE_ACRONYM_AR,'XXACRONYMXX')
+	elif language=='HE': # brings all spellings into one character space
+		text,origin=rewrite(text,origin,RE_ACRONYM_HE,'XXACRONYMXX')
+	elif language=='MA' or language=='SR': # brings all spellings into one character space
+		text,origin=transliterate(text,language,origin)
+	elif language=='EN' or language=='AL': # strips special characters and accents
+		text,origin=rewrite(text,origin,RE_GENITIVE,' ')
+		text,origin=rewrite(text,origin,RE_INWORD_APO,' ')
+	elif language=='FR': # does NOT strip special characters and accents
+		text,origin=rewrite(text,origin,TABLE_FR)
+		text,origin=rewrite(text,origin,RE_INWORD_APO,' ')
+	return [text,origin]
+
 # TOWORDS transforms a raw unicode text string (title, subtitle, text) into a
 # tuple of words.
 # At the same time, it cleans up many special characters, depending on the language:
@@ -340,292 +982,393 @@ def importdict(dictionary):
 # apostrophes are replaced by spaces, so 'I'm' becomes 'I m', or ['I', 'm'] as tuple.
 #
 def towords(text,language):
-	import re
+	return lexwords(text,language,0)[0]
+
+# LEXWORDS splits a raw unicode text string into the words obtained from TOWORDS in a
+# single pass of the compiled expression RE_LEX over the cleaned up text. It returns
+# [<words>, <spans>], where spans lists the [start, end] character offsets of each word
+# in the raw text, such that text[start:end] is the raw form of the word. Words that
+# replace sentence and paragraph syntax span the replaced character; the additional
+# 'xxx' words have empty spans after it. If offsets=0, spans is None.
+def lexwords(text,language,offsets=1):
 	if text==None:
 		text=''
-	text=text.lower()+''
-	text=text.replace("’","'").replace("‘","'").replace("´","'").replace("`","'")
-	text=re.sub('´',"'",text)
-	text=text.replace('“','"').replace('”','"').replace('« ','"').replace(' »','"').replace('«','"').replace('»','"')
-	text=text.replace('%',' % ').replace('$',' $ ').replace('€',' € ').replace('&',' & ').replace('@',' @ ').replace('#',' # ').replace('*',' * ').replace('(',' ( ').replace(')',' ) ').replace('[',' [ ').replace(']',' ] ').replace('{',' { ').replace('}',' } ')
-	text=text.replace('  ',' ').replace('  ',' ').replace('  ',' ')
-	text=text.strip()
-	if language=='AR': # brings all spellings into one character space
-		text=text.replace('ـ','').replace('ס','').replace('؛','').replace('ً','').replace('ٌ','').replace('ٍ','').replace('َ','').replace('ُ','').replace('ِ','').replace('ّ','').replace('ْ','').replace('٠','0').replace('١','1').replace('٢','2').replace('٣','3').replace('٤','4').replace('٥','5').replace('٦','6').replace('٧','7').replace('٨','8').replace('٩','9').replace('ی','ى').replace('پ','ب').replace('چ','غ').replace('ڤ','و').replace('گ','ج').replace('ۆ','و').replace('إ','ا').replace('أ','ا').replace('آ','اا')
-		apo=re.compile(r'(?<=\w)[\'\"](?=\w)')
-		text=apo.sub('XXACRONYMXX',text)
-	elif language=='HE': # brings all spellings into one character space
-		apo=re.compile(r'(?<=\w)[\'\"]+(?=\w)')
-		text=apo.sub('XXACRONYMXX',text)
-	elif language=='MA': # brings all spellings into one character space
-		text=re.sub(r'c(?!h)','ts',text)
-		text=text.replace('č','ch').replace('dzh','dj').replace('ẑ','dz').replace('ž','zh').replace('ǵ','gj').replace('đ','gj').replace('ǰ','j').replace('ḱ','kj').replace('ć','kj').replace('dž','dj').replace('š','sh')
-		text=text.replace('а','a').replace('б','b').replace('в','v').replace('г','g').replace('д','d').replace('ѓ','gj').replace('е','e').replace('ж','zh').replace('з','z').replace('ѕ','dz').replace('и','i').replace('ј','j').replace('к','k').replace('л','l').replace('љ','lj').replace('м','m').replace('н','n').replace('њ','nj').replace('о','o').replace('п','p').replace('р','r').replace('с','s').replace('т','t').replace('ќ','kj').replace('у','u').replace('ф','f').replace('х','h').replace('ц','ts').replace('ч','ch').replace('џ','dj').replace('ш','sh')
-#		text=unidecode(unicode(text))
-	elif language=='SR': # brings all spellings into one character space
-		text=re.sub(r'c(?!h)','ts',text)
-		text=text.replace('č','ch').replace('ž','zh').replace('ć','kj').replace('đ','dj').replace('dž','dj').replace('š','sh')
-		text=text.replace('а','a').replace('б','b').replace('в','v').replace('г','g').replace('д','d').replace('ђ','gj').replace('е','e').replace('ж','zh').replace('з','z').replace('и','i').replace('ј','j').replace('к','k').replace('л','l').replace('љ','lj').replace('м','m').replace('н','n').replace('њ','nj').replace('о','o').replace('п','p').replace('р','r').replace('с','s').replace('т','t').replace('ћ','kj').replace('у','u').replace('ф','f').replace('х','h').replace('ц','ts').replace('ч','č').replace('џ','dj').replace('ш','sh')
-	elif language=='EN': # strips special characters and accents
-		text=re.sub('\'s ',' ',text)
-		text=re.sub('(?<=\w)\'(?=\w)',' ',text)
-	elif language=='FR': # does NOT strip special characters and accents
-		text=text.replace('œ','oe').replace('æ','ae').replace('ï','i').replace('ü','u').replace('ÿ','y')
-		ap=re.finditer('(?<=\w)\'(?=\w)',text)
-		for apo in ap:
-			text=text[:apo.start()]+' '+text[apo.start()+1:]
-	elif language=='AL': # strips special characters and accents
-		text=re.sub('\'s ',' ',text)
-		text=re.sub('(?<=\w)\'(?=\w)',' ',text)
-		text=text.replace('ë','e#')
-		text=text.replace('e#','ë')
-	text=re.sub('(?<=[\s\n\r\t])"(?=\w)',' xxlqu ',text)
-	text=re.sub('(?<=[\w\d\.\!\?\:\;\,])"(?=[\s\.\!\?\:\;\,])',' xxrqu ',text)
-	text=re.sub('(?<=\A)"(?=\w)',' xxlqu ',text)
-	text=re.sub('(?<=[\w\d\.\!\?\:\;\,])"(?=\Z)',' xxrqu ',text)
-	text=text+' '
-	text=text.replace('\n \n','\n').replace('\n\n','\n').replace('\n\n','\n').replace('\n',' xxpar xxx xxx xxx xxx ').replace('\'',' xxapo ').replace('-',' xxdash ').replace('. ',' xxdot xxx xxx ').replace('! ',' xxexc xxx xxx ').replace('? ',' xxque xxx xxx ').replace(', ',' xxcom ').replace(': ',' xxcol ').replace('; ',' xxsem ')
-	text=text.replace('xxcol xxpar','xxcolpar xxpar')
-	text=text.strip()
-	text=re.sub('\s+',' ',text)
-	words=re.compile('\s+').split(text)
-	if language=='AR' or language=='HE':
-		for wd in range(len(words)):
-			words[wd]=words[wd].replace('XXACRONYMXX','"')
-	return words
+	lowered=text.lower()
+	origin=None
+	if offsets==1 and len(lowered)==len(text):
+		origin=list(range(len(text)))
+	elif offsets==1:	#SOME CHARACTERS HAVE LONGER LOWERCASE FORMS
+		origin=[i for i in range(len(text)) for c in text[i].lower()]
+	text,origin=normalize(lowered,language,origin)
+	acronyms=language=='AR' or language=='HE'
+	words=[]
+	spans=[]
+	start=-1
+	for m in RE_LEX.finditer(text):
+		kind=m.lastgroup
+		if kind=='s':	#WORD FOLLOWED BY A SINGLE SPACE AND ANOTHER WORD
+			if start<0:
+				start=m.start()
+			end=m.end()-1
+			if acronyms:
+				words.append(text[start:end].replace('XXACRONYMXX','"'))
+			else:
+				words.append(text[start:end])
+			spans.append([start,end])
+			start=-1
+			continue
+		if kind=='c' or kind=='p' or kind=='q':	#PART OF A WORD
+			if start<0:
+				start=m.start()
+			end=m.end()
+			continue
+		chars=m.group()
+		at=m.start()
+		if kind=='b':	#PUNCTUATION FOLLOWED BY A SPACE: REPLACED FROM THE LAST CHARACTER, AS LONG AS THE NEXT ONE IS REPLACED FIRST
+			r=len(chars)-1
+			while r>0 and PUNCTUATION[chars[r-1]]>PUNCTUATION[chars[r]]:
+				r=r-1
+			if r>0:
+				if start<0:
+					start=at
+				end=at+r
+			chars=chars[r:]
+			at=at+r
+		if start>=0:
+			if acronyms:
+				words.append(text[start:end].replace('XXACRONYMXX','"'))
+			else:
+				words.append(text[start:end])
+			spans.append([start,end])
+			start=-1
+		if kind=='n':
+			if (chars[0]=='\n' or text.startswith('xxpar',m.end())) and len(words)>0 and spans[-1][1]==at and words[-1].endswith('xxcol'):
+				if chars[0]=='\n' or chars==' ':	#'xxcol' FOLLOWED BY 'xxpar'
+					words[-1]=words[-1]+'par'
+			if '\n' in chars:
+				paragraphs=chars.replace('\n \n','\n').replace('\n\n','\n').replace('\n\n','\n').count('\n')
+				at=at-1
+				for i in range(paragraphs):
+					at=chars.index('\n',at-m.start()+1)+m.start()
+					words.extend(MARKERS['\n'])
+					spans.extend([[at,at+1]]+[[at+1,at+1]]*4)
+		elif kind=='l':
+			words.append('xxlqu')
+			spans.append([at,at+1])
+		elif kind=='r':
+			words.append('xxrqu')
+			spans.append([at,at+1])
+		elif kind!='w':
+			for c in chars:
+				words.extend(MARKERS[c])
+				spans.extend([[at,at+1]]+[[at+1,at+1]]*(len(MARKERS[c])-1))
+				at=at+1
+	if start>=0:
+		if acronyms:
+			words.append(text[start:end].replace('XXACRONYMXX','"'))
+		else:
+			words.append(text[start:end])
+		spans.append([start,end])
+	if len(words)==0:
+		return [[''],[[0,0]] if offsets==1 else None]
+	if offsets==0:
+		return [words,None]
+	return [words,[[origin[s],origin[e-1]+1] if e>s else [origin[s-1]+1]*2 for s,e in spans]]
 	
+# The following functions represent words by integer ids, so that JCODE and JCODE_HA
+# only need to test each distinct word once for each keyword and search term.
+
+# VOCABULARY_SIZE limits the number of words in the vocabulary of an index. As the
+# vocabulary and all that is derived from it (see KEYWORDIDS and TERMIDS) take some
+# 200 bytes per word, they are started anew once a document has taken the vocabulary
+# past this size (see RESETVOCABULARY), so memory use does not grow with the index.
+VOCABULARY_SIZE=200000
+
+# NEWVOCABULARY returns an empty vocabulary, which numbers all words as they are first
+# seen: 'ids' maps each word to its id, and 'words' lists the words by id. The words
+# of MARKERWORDS always have the lowest ids, so an id below len(MARKERWORDS) flags a
+# word that replaces syntax. Under 'terms', the vocabulary keeps the ids of the words
+# matching each search term (see TERMIDS).
+def newvocabulary():
+	vocab={'ids':{},'words':[],'terms':{}}
+	for word in MARKERWORDS:
+		vocab['ids'][word]=len(vocab['words'])
+		vocab['words'].append(word)
+	return vocab
+
+# RESETVOCABULARY starts the vocabulary of an index obtained from INDEXDICT anew, and
+# removes the ids of the matching queries kept for its words.
+def resetvocabulary(index):
+	index['vocab']=newvocabulary()
+	index['keywords']=[]
+
+# WORDIDS returns the ids of a tuple of words obtained from TOWORDS as an array of
+# unsigned integers, and adds all new words to the vocabulary.
+def wordids(vocab,words):
+	from array import array
+	ids=vocab['ids']
+	vwords=vocab['words']
+	wids=array('I')
+	for word in words:
+		wid=ids.get(word)
+		if wid==None:
+			wid=len(vwords)
+			ids[word]=wid
+			vwords.append(word)
+		wids.append(wid)
+	return wids
+
+# TERMIDS returns the set of ids of all words of the vocabulary which match a truncated
+# search term of a Boolean criterion (see TERMPOSITIONS). Each term is only tested
+# against each word once: the ids found so far are kept in the vocabulary, together
+# with the number of words tested, and only words added since are tested again.
+def termids(vocab,term,mypreq=None):
+	import re
+	key=(term,mypreq)
+	entry=vocab['terms'].get(key)
+	if entry==None:
+		entry=[set(),0]
+		vocab['terms'][key]=entry
+	found,tested=entry
+	words=vocab['words']
+	if tested<len(words):	#EVERY MATCHING WORD CONTAINS THE TERM WITHOUT ITS PADDING
+		if mypreq!=None:
+			body=term.strip()
+			rx=re.compile(mypreq+re.escape(body))
+			found.update([wid for wid in range(tested,len(words)) if body in words[wid] and rx.match(words[wid])])
+		else:
+			body=term.strip(' ')
+			found.update([wid for wid in range(tested,len(words)) if body in words[wid] and term in ' '+words[wid]+' '])
+		entry[1]=len(words)
+	return found
+
+# POSINDEX builds a positional index of the ids of a tuple of words obtained from WORDIDS:
+# for every distinct word, it lists the positions at which it occurs in the text. JCODE
+# and JCODE_HA use it to test Boolean criteria without rebuilding the context of each hit.
+# The positions of search terms are resolved by TERMPOSITIONS, and cached in the index
+# under 'terms', so that each term is only resolved once per text.
+def posindex(wids,vocab):
+	pos={}
+	for p in range(len(wids)):
+		if wids[p] in pos:
+			pos[wids[p]].append(p)
+		else:
+			pos[wids[p]]=[p]
+	return {'pos':pos,'terms':{},'vocab':vocab}
+
+# TERMPOSITIONS returns the ordered positions of all words in the positional index
+# obtained from POSINDEX which match a search term of a Boolean criterion. Search terms
+# are padded like keywords (' foo ', ' foo*', '*foo ' and '*foo*' become ' foo ',
+# ' foo', 'foo ' and 'foo', respectively). For JCODE_HA, mypreq specifies the prefixes
+# permitted before the term, which must begin the word; truncation is ignored.
+# Terms that match any text (i.e., empty terms) return None.
+def termpositions(ix,term,mypreq=None):
+	key=(term,mypreq)
+	if key in ix['terms']:
+		return ix['terms'][key]
+	body=term.strip(' ')
+	pl=[]
+	if mypreq!=None and term.strip()=='':
+		pl=None
+	elif mypreq==None and body=='':
+		pl=None
+	elif mypreq==None and term==' '+body+' ':
+		pl=ix['pos'].get(ix['vocab']['ids'].get(body),[])
+	else:
+		wids=termids(ix['vocab'],term,mypreq)
+		if len(wids)<len(ix['pos']):
+			for wid in wids:
+				if wid in ix['pos']:
+					pl.extend(ix['pos'][wid])
+		else:
+			for wid,wl in ix['pos'].items():
+				if wid in wids:
+					pl.extend(wl)
+		pl.sort()
+	ix['terms'][key]=pl
+	return pl
+
+# INWINDOW tests whether any of the ordered positions pl obtained from TERMPOSITIONS
+# lies within the window from position a up to (excluding) position o, other than the
+# position w of the keyword itself.
+def inwindow(pl,a,o,w):
+	import bisect
+	if pl==None:
+		return 1
+	i=bisect.bisect_left(pl,a)
+	while i<len(pl) and pl[i]<o:
+		if pl[i]!=w:
+			return 1
+		i=i+1
+	return 0
+
 # JCODE is the main coding script, which applies the criteria laid down in the
 # dictionary to the tuples of words obtained from TOWORDS.
 # It returns a list of all found concepts, and their word position within the text.
 # JCODE handles all languages except Arabic ('AR') and Hebrew ('HE').
-def jcode(words,dict,date,adjacent=0):
-	import codecs
-	import re
-	import copy
-	import datetime
-	suf=[]
-	prec=[]
-	basestring=str
-	found=[]	#This list collects all matched words and entities
-	lastfound=''
-	lastpos=-1
-	classifier=[]
-	for w in range(len(words)):
-		if not 'xx' in words[w]:
-			sw=' '+words[w]+' '
-			for q in dict:
-				current=q[0]
-				if lastfound!=current or lastpos+5<w or adjacent==1:
-					if not q[3]==[]:
-						fromdate=q[3][0]
-						todate=q[3][1]
-						if '2099' in q[3][0]:
-							if q[3][0]<q[3][1]:
-								fromdate=date[:4]+q[3][0][4:]
-								todate=date[:4]+q[3][1][4:]
-							elif date[:4]+q[3][0][4:]>date:
-								fromdate=str(int(date[:4])-1)+q[3][0][4:]
-								todate=date[:4]+q[3][1][4:]
-							else:
-								fromdate=date[:4]+q[3][0][4:]
-								todate=str(int(date[:4])+1)+q[3][1][4:]
-					itsamatch=0
-					nomatch=0
-					if q[3]==[] or fromdate<=date<=todate:
-						if q[2] in sw:
-							myprec=prec
-							if not q[5][0]=='':
-								for yp in q[5][0]:
-									yp=' '+yp+' '
-									yp=yp.replace('* ','').replace(' *','')
-									myprec=myprec+[yp]
-							mysuf=suf
-							if not q[5][1]=='':
-								for ns in q[5][1]:
-									ns=ns+' '
-									ns=ns.replace('* ','')
-									mysuf=mysuf+[ns]
-							if len(mysuf)!=0:
-								swtemp=sw[sw.find(q[2])+len(q[2]):]
-								for ns in mysuf:
-									if swtemp.startswith(ns):
-										nomatch=1
-							if len(myprec)!=0 and nomatch==0:
+# If the index obtained from INDEXDICT is not passed on, JCODE compiles it itself.
+# If a profile (see PROFILEADD) is passed on, JCODE records its work in it.
+def jcode(words,dict,date,adjacent=0,index=None,profile=None):
+	return jcodefields([words],dict,date,adjacent,index,profile)[0]
+
+# JCODEFIELDS codes several fields of one document (title, subtitle, text) in a
+# single pass. It takes a list of word lists and returns a list of found lists,
+# one per field, with word positions counted within each field as in JCODE.
+# The words are coded by their ids in the vocabulary of the index (see WORDIDS), and
+# the queries whose keyword matches a word are only determined once per word of the
+# vocabulary (see KEYWORDIDS). Words that replace syntax (see MARKERWORDS) are not coded.
+# The vocabulary is only started anew between documents (see VOCABULARY_SIZE).
+# Repeated hits of a concept within five words are skipped within a field, not across fields.
+def jcodefields(fields,dict,date,adjacent=0,index=None,profile=None):
+	import time
+	if index==None:
+		index=indexdict(dict)
+	active=activequeries(dict,index,date)
+	if len(index['vocab']['words'])>VOCABULARY_SIZE:
+		resetvocabulary(index)
+	vocab=index['vocab']
+	markers=len(MARKERWORDS)
+	results=[]
+	for words in fields:
+		wids=wordids(vocab,words)
+		found=[]	#This list collects all matched words and entities
+		lastfound=''
+		lastpos=-1
+		ix=None
+		for w in range(len(wids)):
+			if wids[w]>=markers:
+				candidates,matches,prec=keywordids(index,dict,wids[w],'',profile)
+				if profile!=None:	#ALL CANDIDATES ARE COUNTED, NOT ONLY THE MATCHING ONES
+					matches=candidates
+				for i in matches:
+					if active!=None and not active[i]:
+						continue
+					q=dict[i]
+					current=q[0]
+					if profile!=None:
+						start=time.perf_counter()
+						stats=profileadd(profile,i)
+					if lastfound!=current or lastpos+5<w or adjacent==1:
+						itsamatch=0
+						if i in prec:	#THE KEYWORD MATCHES, AND THE PREVIOUS WORD MUST NOT BE AN EXCLUDED PREFIX
+							itsamatch=1
+							if len(prec[i])!=0:
 								pok=0
 								previous=words[w-1]
-								for yp in myprec:
+								for yp in prec[i]:
 									if yp in previous:
 										pok=1
 								if not pok==1:
-									nomatch=1
-							if nomatch==0:
-								itsamatch=1
-						elif q[2][:-1]+'s ' in sw:
-							myprec=prec
-							if not q[5][0]=='':
-								for yp in q[5][0]:
-									yp=' '+yp+' '
-									yp=yp.replace('* ','').replace(' *','')
-									myprec=myprec+[yp]
-							mysuf=suf
-							if not q[5][1]=='':
-								for ns in q[5][1]:
-									ns=ns+' '
-									ns=ns.replace('* ','')
-									mysuf=mysuf+[ns]
-							if q[2][-1]==' ' and not 's ' in mysuf:
-								if len(myprec)!=0 and nomatch==0:
-									pok=0
-									previous=words[w-1]
-									for yp in myprec:
-										if yp in previous:
-											pok=1
-									if not pok==1:
-										nomatch=1
-								if nomatch==0:
-									itsamatch=1
-								
-					if itsamatch==1:
-						qp=copy.deepcopy(q)
-						no=0
-						while no==0 and len(qp[4])>0:
-							crit=qp[4].pop(0)
-							context=''
-							if crit[1]>w:
-								a=0
-							else:
-								a=w-crit[1]
-							if crit[1]>len(words)-w-1:
-								o=len(words)
-							else:
-								o=w+crit[1]+1
-							for p in range(o-a):
-								if not p+a==w:
-									context=context+' '+words[p+a]
-							context=' '+context+' '
-							c0=crit[2]
-							ok0=0
-							no0=0
-							while ok0==0 and no0==0 and len(c0)>1:
-								c1=c0.pop(1)
-								if isinstance(c1,basestring):
-									if c0[0]==0:
-										if re.search(re.escape(c1),context):
-											ok0=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-									elif c0[0]==1:
-										if not re.search(re.escape(c1),context):
-											no0=1	#WHICH MEANS THAT THE 'AND' CRITERION IS NOT MATCHED
+									itsamatch=0
+						if itsamatch==1:
+							if profile!=None:
+								stats[1]=stats[1]+1
+							no=0
+							if ix==None and len(q[4])>0:
+								ix=posindex(wids,vocab)
+							for crit in q[4]:
+								if profile!=None:
+									stats[2]=stats[2]+1
+								if crit[1]>w:
+									a=0
 								else:
-									ok1=0
-									no1=0
-									while ok1==0 and no1==0 and len(c1)>1:
-										c2=c1.pop(1)
-										if isinstance(c2,basestring):
-											if c1[0]==0:
-												if re.search(re.escape(c2),context):
-													ok1=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-											elif c1[0]==1:
-												if not re.search(re.escape(c2),context):
-													no1=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-										else:
-											ok2=0
-											no2=0
-											while ok2==0 and no2==0 and len(c2)>1:
-												c3=c2.pop(1)
-												if isinstance(c3,basestring):
-													if c2[0]==0:
-														if re.search(re.escape(c3),context):
-															ok2=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-													elif c2[0]==1:
-														if not re.search(re.escape(c3),context):
-															no2=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-												else:
-													ok3=0
-													no3=0
-													while ok3==0 and no3==0 and len(c3)>1:
-														c4=c3.pop(1)
-														if isinstance(c4,basestring):
-															if c3[0]==0:
-																if re.search(re.escape(c4),context):
-																	ok3=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-															elif c3[0]==1:
-																if not re.search(re.escape(c4),context):
-																	no3=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-														else:
-															ok4=0
-															no4=0
-															while ok4==0 and no4==0 and len(c4)>1:
-																c5=c4.pop(1)
-																if isinstance(c5,basestring):
-																	if c4[0]==0:
-																		if re.search(re.escape(c5),context):
-																			ok4=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-																	if c4[0]==1:
-																		if not re.search(re.escape(c5),context):
-																			no4=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-																else:
-																	print('too many brackets')
-															if c4[0]==1 and not no4==1:
-																ok4=1
-															if c4[0]==0 and not ok4==1:
-																no4=1
-															if c3[0]==0 and ok4==1:
-																ok3=1
-															elif c3[0]==1 and no4==1:
-																no3=1
-													if c3[0]==1 and not no3==1:
-														ok3=1
-													if c3[0]==0 and not ok3==1:
-														no3=1
-													if c2[0]==0 and ok3==1:
-														ok2=1
-													elif c2[0]==1 and no3==1:
-														no2=1
-											if c2[0]==1 and not no2==1:
-												ok2=1
-											if c2[0]==0 and not ok2==1:
-												no2=1
-											if c1[0]==0 and ok2==1:
-												ok1=1
-											elif c1[0]==1 and no2==1:
-												no1=1
-									if c1[0]==1 and not no1==1:
-										ok1=1
-									if c1[0]==0 and not ok1==1:
-										no1=1
-									if c0[0]==0 and ok1==1:
-										ok0=1
-									elif c0[0]==1 and no1==1:
-										no0=1
-							if c0[0]==1 and not no0==1:
-								ok0=1
-							if c0[0]==0 and not ok0==1:
-								no0=1
-							if c0[0]==0 and ok0==1: #OR CRITERION MATCHED
-								critok=1
-							elif c0[0]==1 and no0==0: #AND CRITERION MATCHED
-								critok=1
-							else:
-								critok=0
-							if critok==1 and crit[0]==0:	#IF THIS WAS AN ABSENCE CRITERION
-								no=1	#TERMINATES THE LOOP WITHOUT CODING
-							elif critok==0 and crit[0]==1:	#IF THIS WAS A PRESENCE CRITERION
-								no=1	#TERMINATES THE LOOP WITHOUT CODING
-								#ELSE, THIS WAS A MATCHED PRESENCE CRITERION OR AN UNMATCHED ABSENCE CRITERION, AND THE LOOP JUST CONTINUES TO THE NEXT CRITERION
-						if len(qp[4])==0 and no==0:	#IF IT GETS TO HERE, ALL CRITERIA ARE MATCHED
-							found.append([w,qp[0]])	#LISTS THE WORD POSITION AND ENTITY ID
-							lastfound=qp[0]
-							lastpos=w
-	return found
-'''
-no# REMAINS 0 IF A BRACKET WAS 'OR' OR IF AN 'AND' BRACKET HAS BEEN MATCHED, HENCE c#[0]*(1-no4)=1
-ok# BECOMES 1 IF AN 'OR' BRACKET HAS BEEN MATCHED, HENCE (1-c#[0])*ok=1
-FOR ALL 'OR' BRACKETS, c#[0]*(1-no4) REMAINS ZERO BECAUSE c#[0] IS ZERO
-FOR ALL 'AND' BRACKETS, (1-c#[0])*ok REMAINS ZERO BECAUSE c#[1] IS ONE
-IF no# IS 0 AND ok# IS 1, THEREFORE, THE CRITERION OF THE NEXT HIGHER BRACKED IS MATCHED
-IF THE NEXT HIGHER BRACKET IS AN 'OR' BRACKET, ANY MATCHED COMPONENT MATCHES THE BRACKET
-IF IT WAS AN 'AND' BRACKET, THE no# CRITERION IS KEPT AT ZERO AND THE TEST CONTINUES
-'''
+									a=w-crit[1]
+								if crit[1]>len(wids)-w-1:
+									o=len(wids)
+								else:
+									o=w+crit[1]+1
+								critok=evalcrit(crit[2],lambda term: inwindow(termpositions(ix,term),a,o,w))
+								if critok==1 and crit[0]==0:	#IF THIS WAS AN ABSENCE CRITERION
+									no=1	#TERMINATES THE LOOP WITHOUT CODING
+									break
+								elif critok==0 and crit[0]==1:	#IF THIS WAS A PRESENCE CRITERION
+									no=1	#TERMINATES THE LOOP WITHOUT CODING
+									break
+									#ELSE, THIS WAS A MATCHED PRESENCE CRITERION OR AN UNMATCHED ABSENCE CRITERION, AND THE LOOP JUST CONTINUES TO THE NEXT CRITERION
+							if no==0:	#IF IT GETS TO HERE, ALL CRITERIA ARE MATCHED
+								found.append([w,q[0]])	#LISTS THE WORD POSITION AND ENTITY ID
+								lastfound=q[0]
+								lastpos=w
+								if profile!=None:
+									stats[3]=stats[3]+1
+					if profile!=None:
+						stats[4]=stats[4]+time.perf_counter()-start
+		results.append(found)
+	return results
+
+# KEYWORDIDS returns, for the word with the id wid in the vocabulary of the index obtained
+# from INDEXDICT, [<candidates>, <matches>, <prefixes>]: the ordered positions of all
+# queries whose keyword may match the word (see LOOKUPWORD), the ordered positions of
+# those whose keyword does match it (see KEYWORDMATCH or, if lang is 'AR' or 'HE',
+# KEYWORDMATCH_HA), and for each of the latter, the excluded prefixes which JCODE tests
+# against the previous word. This is done once per word of the vocabulary; the result
+# is kept in the index under 'keywords'. If a profile (see PROFILEADD) is passed on, the
+# time spent on this is counted for the candidate codephrases: the time of LOOKUPWORD in
+# equal shares, and the time of testing each keyword for its codephrase.
+NOKEYWORDS=[[],[],{}]
+def keywordids(index,dict,wid,lang='',profile=None):
+	import time
+	keywords=index['keywords']
+	if wid<len(keywords) and keywords[wid]!=None:
+		return keywords[wid]
+	if wid>=len(keywords):
+		keywords.extend([None]*(wid+1-len(keywords)))
+	word=index['vocab']['words'][wid]
+	if profile!=None:
+		start=time.perf_counter()
+	candidates=lookupword(index,word)
+	if profile!=None and len(candidates)>0:
+		share=(time.perf_counter()-start)/len(candidates)
+		for i in candidates:
+			profiletime(profile,i,share)
+	matches=[]
+	prec={}
+	for i in candidates:
+		if profile!=None:
+			start=time.perf_counter()
+		if lang=='AR' or lang=='HE':
+			if keywordmatch_ha(dict[i],word,lang)==1:
+				matches.append(i)
+				prec[i]=[]
+		elif keywordmatch(dict[i],word)==1:
+			matches.append(i)
+			prec[i]=[]
+			if not dict[i][5][0]=='':
+				for yp in dict[i][5][0]:
+					yp=' '+yp+' '
+					yp=yp.replace('* ','').replace(' *','')
+					prec[i].append(yp)
+		if profile!=None:
+			profiletime(profile,i,time.perf_counter()-start)
+	if candidates==[]:
+		keywords[wid]=NOKEYWORDS
+	else:
+		keywords[wid]=[candidates,matches,prec]
+	return keywords[wid]
+
+# KEYWORDMATCH tests whether the keyword of a query q matches a word, as applied by JCODE:
+# The keyword (or its plural form, if the keyword is not truncated at the end) must
+# be contained in the word, and must not be followed by an excluded suffix. Returns 1 if
+# the keyword matches, else 0. Excluded prefixes are tested by JCODE.
+def keywordmatch(q,word):
+	sw=' '+word+' '
+	mysuf=[]
+	if not q[5][1]=='':
+		for ns in q[5][1]:
+			ns=ns+' '
+			ns=ns.replace('* ','')
+			mysuf=mysuf+[ns]
+	if q[2] in sw:
+		if len(mysuf)!=0:
+			swtemp=sw[sw.find(q[2])+len(q[2]):]
+			for ns in mysuf:
+				if swtemp.startswith(ns):
+					return 0
+		return 1
+	elif q[2][:-1]+'s ' in sw:
+		if q[2][-1]==' ' and not 's ' in mysuf:
+			return 1
+	return 0
 
 # JCODE_HA is a variant of the main coding script, which applies the criteria laid
 # down in the dictionary to the tuples of words obtained from TOWORDS.
@@ -633,264 +1376,509 @@ IF IT WAS AN 'AND' BRACKET, THE no# CRITERION IS KEPT AT ZERO AND THE TEST CONTI
 # JCODE handles the languages Arabic ('AR') and Hebrew ('HE').
 # The main difference is that these two languages use prefixes to express many
 # conjunctions and articles, so the algorithm allows for certain prefixes to appear
-# before the keyword. It also allows specific regular suffixes. Both are defined as
-# mypref1 (one-character prefixes), mypref2 (multi-character prefixes), and mysuf (suffixes).
+# before the keyword. It also allows specific regular suffixes (see KEYWORDMATCH_HA).
 # mypreq specifies those prefixes allowed for terms within the Boolean query, which
 # is more restrictive than the list of keyword prefixes.
-def jcode_ha(words,dict,date,lang,adjacent=0):
-	import codecs
-	import re
-	import copy
-	import datetime
-	basestring=str
-	found=[]	#This file collects all matched words and entities
-	lastfound=''
-	classifier=[]
-	for w in range(len(words)):
-		if not 'xx' in words[w]:
-			sw=' '+words[w]+' ' ## ' searchword '
-			for q in dict:
-				current=q[0]
-				if lastfound!=current or lastpos+5<w or adjacent==1:
-					if not q[3]==[]:
-						fromdate=q[3][0]
-						todate=q[3][1]
-						if '2099' in q[3][0]:
-							if q[3][0]<q[3][1]:
-								fromdate=date[:4]+q[3][0][4:]
-								todate=date[:4]+q[3][1][4:]
-							elif date[:4]+q[3][0][4:]>date:
-								fromdate=str(int(date[:4])-1)+q[3][0][4:]
-								todate=date[:4]+q[3][1][4:]
-							else:
-								fromdate=date[:4]+q[3][0][4:]
-								todate=str(int(date[:4])+1)+q[3][1][4:]
-					if lang=='AR':
-						mypref1='فمكبولتينل'
-						mypref2=['ال','لل','فال'] #بال
-						mysuf=['ان ','ين ','ية ','ة ','كن ','ها ','هم ','ه ','ك ','كم ','ي ','وا ','ن ','ت ','تم ','تن ','نا ','ون ','ا']
-						mypreq='(?:[فمكبولتينل])?(?:ال)?(?:لل)?'
-					elif lang=='HE':
-						mypref1='ובכלמהשאיתנ'
-						mypref2=['מה']
-						mysuf=['ים ','ות ','י ','כ ','ו ','נו ','הם ','הן ','כם ','כן ','ה ','תי ','תם ','תן ','ת ','ך ','ן ','ם ','ית ']
-						mypreq='(?:[וש])?(?:[בכלמהאיתנ])?'
-					notpref=''
-					if q[5][0]=='*':
-						mypref1=''
-						mypref2=''
-						notpref='غظضذخثتشرقصفعسنملكيطحزوهدجباאבגדהוזחטיכךלמםנןסעפףצץקרשת'
-					elif not q[5][0]=='':
-						for nop in q[5][0]:
-							notpref=notpref+nop
-							mypref1=mypref1.replace(nop,'')
-							pl=len(mypref2)
-							for pp in range(pl):
-								if nop in mypref2[pl-pp-1]:
-									mypref2.pop(pl-pp-1)
-					notsuf=''
-					if q[5][1]=='*':
-						mysuf=''
-						notsuf='غظضذخثتشرقصفعسنملكيطحزوهدجباאבגדהוזחטיכךלמםנןסעפףצץקרשת'
-					if not q[5][1]=='':
-						for nos in q[5][1]:
-							notsuf=notsuf+nos
-							sl=len(mysuf)
-							for ss in range(sl):
-								if mysuf[sl-ss-1]==nos:
-									mysuf.pop(sl-ss-1)
-					
-					itsamatch=0
-					if q[3]==[] or fromdate<=date<=todate:
-						if q[2].strip() in sw:
-							if q[2] in sw:
-								itsamatch=1	# REGISTERS IF KEYWORD = SEARCHWORD OR IF KEYW* => SEARCHWORD
-							elif q[2] in ' '+sw[2:]:
-								if sw[1] in mypref1:
-									itsamatch=1	# REGISTERS IF 1-LETTER-PREFIX+KEYWORD = SEARCHWORD OR IF 1-LETTER-PREFIX+KEYW => SEARCHWORD
-							elif q[2] in ' '+sw[3:]:
-								for prf2 in mypref2:
-									if len(prf2)==2:
-										if sw[1:3]==prf2:
-											itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
-								if itsamatch==0:
-									if sw[1] in 'וש':
-										if sw[2] in mypref1.replace('ש','').replace('ו',''):
-											itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
-							elif q[2] in ' '+sw[4:]:
-								for prf2 in mypref2:
-									if len(prf2)==3:
-										if sw[1:4]==prf2:
-											itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
-							elif q[2][:-1] in sw: 
-								if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
-									if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
-										itsamatch=1	# REGISTERS IF KEYWORD+SUFFIX = SEARCHWORD OR IF *KEYWORD+SUFFIX => SEARCHWORD
-							elif q[2][:-1] in ' '+sw[2:]:
-								if sw[1] in mypref1:
-									if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
-										if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
-											itsamatch=1	# REGISTERS IF PREFIX+KEYWORD+SUFFIX = SEARCHWORD
-							elif q[2][:-1] in ' '+sw[3:]:
-								for prf2 in mypref2:
-									if sw[1:3]==prf2:
-										if len(prf2)==2:
-											if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
-												if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
-													itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
-								if itsamatch==0:
-									if sw[1] in 'וש':
-										if sw[2] in mypref1.replace('ש','').replace('ו',''):
-											if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
-												if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
-													itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
-							elif q[2][:-1] in ' '+sw[4:]:
-								for prf2 in mypref2:
-									if len(prf2)==3:
-										if sw[1:3]==prf2:
-											if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
-												if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
-													itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
-					if itsamatch==1:
-						qp=copy.deepcopy(q)
-						no=0
-						while no==0 and len(qp[4])>0:
-							crit=qp[4].pop(0)
-							context=''
-							if crit[1]>w:
-								a=0
-							else:
-								a=w-crit[1]
-							if crit[1]>len(words)-w:
-								o=len(words)
-							else:
-								o=w+crit[1]
-							for p in range(o-a):
-								if not p+a==w:
-									context=context+' '+words[p+a]
-							context=' '+context+' '
-							c0=crit[2]
-							ok0=0
-							no0=0
-							while ok0==0 and no0==0 and len(c0)>1:
-								c1=c0.pop(1)
-								if isinstance(c1,basestring):
-									if c0[0]==0:
-										if re.search(r' '+mypreq+re.escape(c1.strip()),context):
-											ok0=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-									elif c0[0]==1:
-										if not re.search(r' '+mypreq+re.escape(c1.strip()),context):
-											no0=1	#WHICH MEANS THAT THE 'AND' CRITERION IS NOT MATCHED
+# If the index obtained from INDEXDICT is not passed on, JCODE_HA compiles it itself.
+# If a profile (see PROFILEADD) is passed on, JCODE_HA records its work in it.
+def jcode_ha(words,dict,date,lang,adjacent=0,index=None,profile=None):
+	return jcodefields_ha([words],dict,date,lang,adjacent,index,profile)[0]
+
+# JCODEFIELDS_HA is the counterpart of JCODEFIELDS for Arabic and Hebrew, coding
+# several fields of one document in a single pass of JCODE_HA.
+def jcodefields_ha(fields,dict,date,lang,adjacent=0,index=None,profile=None):
+	import time
+	if index==None:
+		index=indexdict(dict,lang)
+	if lang=='AR':
+		mypreq='(?:[فمكبولتينل])?(?:ال)?(?:لل)?'
+	elif lang=='HE':
+		mypreq='(?:[וש])?(?:[בכלמהאיתנ])?'
+	active=activequeries(dict,index,date)
+	if len(index['vocab']['words'])>VOCABULARY_SIZE:
+		resetvocabulary(index)
+	vocab=index['vocab']
+	markers=len(MARKERWORDS)
+	results=[]
+	for words in fields:
+		wids=wordids(vocab,words)
+		found=[]	#This list collects all matched words and entities
+		lastfound=''
+		lastpos=-1
+		ix=None
+		for w in range(len(wids)):
+			if wids[w]>=markers:
+				candidates,matches,prec=keywordids(index,dict,wids[w],lang,profile)
+				if profile!=None:	#ALL CANDIDATES ARE COUNTED, NOT ONLY THE MATCHING ONES
+					matches=candidates
+				for i in matches:
+					if active!=None and not active[i]:
+						continue
+					q=dict[i]
+					current=q[0]
+					if profile!=None:
+						start=time.perf_counter()
+						stats=profileadd(profile,i)
+					if lastfound!=current or lastpos+5<w or adjacent==1:
+						if i in prec:	#THE KEYWORD MATCHES
+							if profile!=None:
+								stats[1]=stats[1]+1
+							no=0
+							if ix==None and len(q[4])>0:
+								ix=posindex(wids,vocab)
+							for crit in q[4]:
+								if profile!=None:
+									stats[2]=stats[2]+1
+								if crit[1]>w:
+									a=0
 								else:
-									ok1=0
-									no1=0
-									while ok1==0 and no1==0 and len(c1)>1:
-										c2=c1.pop(1)
-										if isinstance(c2,basestring):
-											if c1[0]==0:
-												if re.search(r' '+mypreq+re.escape(c2.strip()),context):
-													ok1=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-											elif c1[0]==1:
-												if not re.search(r' '+mypreq+re.escape(c2.strip()),context):
-													no1=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-										else:
-											ok2=0
-											no2=0
-											while ok2==0 and no2==0 and len(c2)>1:
-												c3=c2.pop(1)
-												if isinstance(c3,basestring):
-													if c2[0]==0:
-														if re.search(r' '+mypreq+re.escape(c3.strip()),context):
-															ok2=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-													elif c2[0]==1:
-														if not re.search(r' '+mypreq+re.escape(c3.strip()),context):
-															no2=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-												else:
-													ok3=0
-													no3=0
-													while ok3==0 and no3==0 and len(c3)>1:
-														c4=c3.pop(1)
-														if isinstance(c4,basestring):
-															if c3[0]==0:
-																if re.search(r' '+mypreq+re.escape(c4.strip()),context):
-																	ok3=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-															elif c3[0]==1:
-																if not re.search(r' '+mypreq+re.escape(c4.strip()),context):
-																	no3=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-														else:
-															ok4=0
-															no4=0
-															while ok4==0 and no4==0 and len(c4)>1:
-																c5=c4.pop(1)
-																if isinstance(c5,basestring):
-																	if c4[0]==0:
-																		if re.search(r' '+mypreq+re.escape(c5.strip()),context):
-																			ok4=1	#WHICH MEANS THAT THE 'OR' CRITERION IS MATCHED
-																	if c4[0]==1:
-																		if not re.search(r' '+mypreq+re.escape(c5.strip()),context):
-																			no4=1	#WHICH MEANS THAT THE 'AND' CRITERION NOT IS MATCHED
-																else:
-																	print('too many brackets')
-															if c4[0]==1 and not no4==1:
-																ok4=1
-															if c4[0]==0 and not ok4==1:
-																no4=1
-															if c3[0]==0 and ok4==1:
-																ok3=1
-															elif c3[0]==1 and no4==1:
-																no3=1
-													if c3[0]==1 and not no3==1:
-														ok3=1
-													if c3[0]==0 and not ok3==1:
-														no3=1
-													if c2[0]==0 and ok3==1:
-														ok2=1
-													elif c2[0]==1 and no3==1:
-														no2=1
-											if c2[0]==1 and not no2==1:
-												ok2=1
-											if c2[0]==0 and not ok2==1:
-												no2=1
-											if c1[0]==0 and ok2==1:
-												ok1=1
-											elif c1[0]==1 and no2==1:
-												no1=1
-									if c1[0]==1 and not no1==1:
-										ok1=1
-									if c1[0]==0 and not ok1==1:
-										no1=1
-									if c0[0]==0 and ok1==1:
-										ok0=1
-									elif c0[0]==1 and no1==1:
-										no0=1
-							if c0[0]==1 and not no0==1:
-								ok0=1
-							if c0[0]==0 and not ok0==1:
-								no0=1
-							if c0[0]==0 and ok0==1: #OR CRITERION MATCHED
-								critok=1
-							elif c0[0]==1 and no0==0: #AND CRITERION MATCHED
-								critok=1
-							else:
-								critok=0
-							if critok==1 and crit[0]==0:	#IF THIS WAS AN ABSENCE CRITERION
-								no=1	#TERMINATES THE LOOP WITHOUT CODING
-							elif critok==0 and crit[0]==1:	#IF THIS WAS A PRESENCE CRITERION
-								no=1	#TERMINATES THE LOOP WITHOUT CODING
-								#ELSE, THIS WAS A MATCHED PRESENCE CRITERION OR AN UNMATCHED ABSENCE CRITERION, AND THE LOOP JUST CONTINUES TO THE NEXT CRITERION
-						if len(qp[4])==0 and no==0:	#IF IT GETS TO HERE, ALL CRITERIA ARE MATCHED
-							found.append([w,qp[0]])	#LISTS THE WORD POSITION AND ENTITY ID
-							lastfound=qp[0]
-	return found
-'''
-no# REMAINS 0 IF A BRACKET WAS 'OR' OR IF AN 'AND' BRACKET HAS BEEN MATCHED, HENCE c#[0]*(1-no4)=1
-ok# BECOMES 1 IF AN 'OR' BRACKET HAS BEEN MATCHED, HENCE (1-c#[0])*ok=1
-FOR ALL 'OR' BRACKETS, c#[0]*(1-no4) REMAINS ZERO BECAUSE c#[0] IS ZERO
-FOR ALL 'AND' BRACKETS, (1-c#[0])*ok REMAINS ZERO BECAUSE c#[1] IS ONE
-IF no# IS 0 AND ok# IS 1, THEREFORE, THE CRITERION OF THE NEXT HIGHER BRACKED IS MATCHED
-IF THE NEXT HIGHER BRACKET IS AN 'OR' BRACKET, ANY MATCHED COMPONENT MATCHES THE BRACKET
-IF IT WAS AN 'AND' BRACKET, THE no# CRITERION IS KEPT AT ZERO AND THE TEST CONTINUES
-'''
+									a=w-crit[1]
+								if crit[1]>len(wids)-w:
+									o=len(wids)
+								else:
+									o=w+crit[1]
+								critok=evalcrit(crit[2],lambda term: inwindow(termpositions(ix,term,mypreq),a,o,w))
+								if critok==1 and crit[0]==0:	#IF THIS WAS AN ABSENCE CRITERION
+									no=1	#TERMINATES THE LOOP WITHOUT CODING
+									break
+								elif critok==0 and crit[0]==1:	#IF THIS WAS A PRESENCE CRITERION
+									no=1	#TERMINATES THE LOOP WITHOUT CODING
+									break
+									#ELSE, THIS WAS A MATCHED PRESENCE CRITERION OR AN UNMATCHED ABSENCE CRITERION, AND THE LOOP JUST CONTINUES TO THE NEXT CRITERION
+							if no==0:	#IF IT GETS TO HERE, ALL CRITERIA ARE MATCHED
+								found.append([w,q[0]])	#LISTS THE WORD POSITION AND ENTITY ID
+								lastfound=q[0]
+								lastpos=w
+								if profile!=None:
+									stats[3]=stats[3]+1
+					if profile!=None:
+						stats[4]=stats[4]+time.perf_counter()-start
+		results.append(found)
+	return results
+
+# KEYWORDMATCH_HA tests whether the keyword of a query q matches a word in Arabic ('AR')
+# or Hebrew ('HE'), as applied by JCODE_HA, allowing for the prefixes and suffixes of the
+# language. They are defined as mypref1 (one-character prefixes), mypref2 (multi-character
+# prefixes), and mysuf (suffixes). Returns 1 if the keyword matches, else 0.
+def keywordmatch_ha(q,word,lang):
+	sw=' '+word+' ' ## ' searchword '
+	if lang=='AR':
+		mypref1='فمكبولتينل'
+		mypref2=['ال','لل','فال'] #بال
+		mysuf=['ان ','ين ','ية ','ة ','كن ','ها ','هم ','ه ','ك ','كم ','ي ','وا ','ن ','ت ','تم ','تن ','نا ','ون ','ا']
+	elif lang=='HE':
+		mypref1='ובכלמהשאיתנ'
+		mypref2=['מה']
+		mysuf=['ים ','ות ','י ','כ ','ו ','נו ','הם ','הן ','כם ','כן ','ה ','תי ','תם ','תן ','ת ','ך ','ן ','ם ','ית ']
+	notpref=''
+	if q[5][0]=='*':
+		mypref1=''
+		mypref2=''
+		notpref='غظضذخثتشرقصفعسنملكيطحزوهدجباאבגדהוזחטיכךלמםנןסעפףצץקרשת'
+	elif not q[5][0]=='':
+		for nop in q[5][0]:
+			notpref=notpref+nop
+			mypref1=mypref1.replace(nop,'')
+			pl=len(mypref2)
+			for pp in range(pl):
+				if nop in mypref2[pl-pp-1]:
+					mypref2.pop(pl-pp-1)
+	notsuf=''
+	if q[5][1]=='*':
+		mysuf=''
+		notsuf='غظضذخثتشرقصفعسنملكيطحزوهدجباאבגדהוזחטיכךלמםנןסעפףצץקרשת'
+	if not q[5][1]=='':
+		for nos in q[5][1]:
+			notsuf=notsuf+nos
+			sl=len(mysuf)
+			for ss in range(sl):
+				if mysuf[sl-ss-1]==nos:
+					mysuf.pop(sl-ss-1)
+
+	itsamatch=0
+	if q[2].strip() in sw:
+		if q[2] in sw:
+			itsamatch=1	# REGISTERS IF KEYWORD = SEARCHWORD OR IF KEYW* => SEARCHWORD
+		elif q[2] in ' '+sw[2:]:
+			if sw[1] in mypref1:
+				itsamatch=1	# REGISTERS IF 1-LETTER-PREFIX+KEYWORD = SEARCHWORD OR IF 1-LETTER-PREFIX+KEYW => SEARCHWORD
+		elif q[2] in ' '+sw[3:]:
+			for prf2 in mypref2:
+				if len(prf2)==2:
+					if sw[1:3]==prf2:
+						itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
+			if itsamatch==0:
+				if sw[1] in 'וש':
+					if sw[2] in mypref1.replace('ש','').replace('ו',''):
+						itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
+		elif q[2] in ' '+sw[4:]:
+			for prf2 in mypref2:
+				if len(prf2)==3:
+					if sw[1:4]==prf2:
+						itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD = SEARCHWORD OR IF DOUBLEPREFIX+KEYW => SEARCHWORD
+		elif q[2][:-1] in sw: 
+			if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
+				if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
+					itsamatch=1	# REGISTERS IF KEYWORD+SUFFIX = SEARCHWORD OR IF *KEYWORD+SUFFIX => SEARCHWORD
+		elif q[2][:-1] in ' '+sw[2:]:
+			if sw[1] in mypref1:
+				if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
+					if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
+						itsamatch=1	# REGISTERS IF PREFIX+KEYWORD+SUFFIX = SEARCHWORD
+		elif q[2][:-1] in ' '+sw[3:]:
+			for prf2 in mypref2:
+				if sw[1:3]==prf2:
+					if len(prf2)==2:
+						if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
+							if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
+								itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
+			if itsamatch==0:
+				if sw[1] in 'וש':
+					if sw[2] in mypref1.replace('ש','').replace('ו',''):
+						if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
+							if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
+								itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
+		elif q[2][:-1] in ' '+sw[4:]:
+			for prf2 in mypref2:
+				if len(prf2)==3:
+					if sw[1:3]==prf2:
+						if sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in mysuf:
+							if not sw[sw.find(q[2][:-1])+len(q[2][:-1]):] in notsuf:
+								itsamatch=1	# REGISTERS IF DOUBLEPREFIX+KEYWORD+SUFFIX = SEARCHWORD
+	return itsamatch
+
+# The following functions account for the work of JCODE and JCODE_HA per codephrase of
+# the dictionary, to find codephrases that are expensive to apply.
+# PROFILEADD counts a codephrase, given by its number in the dictionary, as a candidate
+# for a word in the profile {<codephrase number>: [<candidates>, <keyword hits>,
+# <criterion evaluations>, <matches>, <seconds>]}, and returns its entry. The time spent
+# on the positional index of a text is counted for the first codephrase that needs it.
+# The time spent on finding the codephrases whose keyword matches a word is counted
+# when the word is first seen (see KEYWORDIDS).
+def profileadd(profile,i):
+	stats=profiletime(profile,i,0.0)
+	stats[0]=stats[0]+1
+	return stats
+
+# PROFILETIME adds seconds spent on a codephrase to its entry in the profile (see
+# PROFILEADD), without counting it as a candidate, and returns the entry.
+def profiletime(profile,i,seconds):
+	if i in profile:
+		stats=profile[i]
+	else:
+		stats=[0,0,0,0,0.0]
+		profile[i]=stats
+	stats[4]=stats[4]+seconds
+	return stats
+
+# PROFILEMERGE adds the entries of one profile to those of another.
+def profilemerge(profile,other):
+	for i in other:
+		if i in profile:
+			for s in range(5):
+				profile[i][s]=profile[i][s]+other[i][s]
+		else:
+			profile[i]=list(other[i])
+
+# PROFILEREPORT writes the profiles of several dictionaries, named in names, into a file,
+# ranked by the time spent on each codephrase. Keywords are written with their truncation.
+def profilereport(profiles,dicts,names,filename):
+	import codecs
+	rows=[]
+	for d in range(len(profiles)):
+		for i in profiles[d]:
+			rows.append([profiles[d][i][4],d,i])
+	rows.sort(key=lambda row: -row[0])
+	total=sum(row[0] for row in rows)
+	po=codecs.open(filename,'w',encoding='utf-8')
+	po.write('rank,dictionary,concept id,concept name,keyword,criteria,widest window,candidates,keyword hits,criterion evaluations,matches,seconds,share of time\n')
+	for r in range(len(rows)):
+		seconds,d,i=rows[r]
+		q=dicts[d][i]
+		keyword=q[2].strip(' ')
+		if not q[2].startswith(' '):
+			keyword='*'+keyword
+		if not q[2].endswith(' '):
+			keyword=keyword+'*'
+		window=0
+		for crit in q[4]:
+			window=max(window,crit[1])
+		stats=profiles[d][i]
+		share=0.0
+		if total>0:
+			share=seconds/total
+		po.write(str(r+1)+','+names[d]+','+q[0]+','+q[1].replace(',',' ')+','+keyword+','+str(len(q[4]))+','+str(window)+','+str(stats[0])+','+str(stats[1])+','+str(stats[2])+','+str(stats[3])+',%.6f,%.4f\n' % (seconds,share))
+	po.close()
+
+# CODEARTICLE tokenizes the title, subtitle and text of an article obtained from
+# GETTEXTS/ITERTEXTS using TOWORDS, and codes each of them using JCODE or, in Arabic
+# ('AR') and Hebrew ('HE'), JCODE_HA.
+# It returns [<title words>, <title hits>, <subtitle words>, <subtitle hits>,
+# <text words>, <text hits>]. If offsets=1, the words are obtained from LEXWORDS, and
+# their spans in the title, subtitle and text are appended to the list. If a profile
+# is passed on, the coding is recorded in it (see PROFILEADD). If the article has
+# already been tokenized by TOKENARTICLE, its tokens can be passed on.
+def codearticle(article,dict,lang,adjacent=0,index=None,offsets=0,profile=None,tokens=None):
+	id,medium,date,title,subtitle,text=article
+	if tokens==None:
+		tokens=tokenarticle(article,lang,offsets)
+	twords,tspans,swords,sspans,awords,aspans=tokens
+	if lang=='AR' or lang=='HE':
+		tfound,sfound,afound=jcodefields_ha([twords,swords,awords],dict,date,lang,adjacent,index,profile)
+	else:
+		tfound,sfound,afound=jcodefields([twords,swords,awords],dict,date,adjacent,index,profile)
+	if offsets==1:
+		return [twords,tfound,swords,sfound,awords,afound,tspans,sspans,aspans]
+	return [twords,tfound,swords,sfound,awords,afound]
+
+# TOKENARTICLE returns the words of the title, subtitle and text of an article, and
+# their spans (see LEXWORDS), as [<title words>, <title spans>, <subtitle words>,
+# <subtitle spans>, <text words>, <text spans>].
+def tokenarticle(article,lang,offsets=0):
+	id,medium,date,title,subtitle,text=article
+	twords,tspans=lexwords(title,lang,offsets)
+	swords,sspans=lexwords(subtitle,lang,offsets)
+	awords,aspans=lexwords(text,lang,offsets)
+	return [twords,tspans,swords,sspans,awords,aspans]
+
+# The following functions keep the words obtained from TOKENARTICLE on disk, so that
+# a corpus that is coded again (e.g., with a revised dictionary) need not be tokenized
+# again. There is one token cache per index and language, in the folder jamcode_cache:
+# tokens_<index>_<language>.<tokenizer version>.dat holds the words of all articles, and
+# tokens_<index>_<language>.<tokenizer version>.idx is its table of contents, with one
+# line <document id>\t<digest>\t<offset>\t<length of words>\t<length of spans> per article.
+# The words of the title, subtitle and text are stored as three lines of words separated
+# by spaces (which words never contain), followed by their spans (if any) as unsigned
+# integers. The data file is read through mmap, so only the articles coded are read.
+# An article is only taken from the cache if its digest (see TOKENDIGEST) is the same,
+# so articles that have changed on the server are tokenized again. Both files are only
+# appended to; a changed article is appended again, and its earlier entry is ignored.
+# If a run was interrupted before all its entries were written, both files are cut back
+# to the last entry whose data is complete when the cache is opened again.
+
+# OPENTOKENCACHE opens the token cache of an index and a language (as used by LEXWORDS),
+# and removes the token caches of other tokenizer versions. It returns a dictionary with
+# the table of contents ('table'), the mapped data file ('map', or None if it is empty),
+# and the files to which new articles are appended.
+def opentokencache(index,lang):
+	import os
+	import glob
+	import mmap
+	os.makedirs('jamcode_cache',exist_ok=True)
+	name=os.path.join('jamcode_cache','tokens_'+index+'_'+lang)
+	cache_file=name+'.'+TOKENIZER_VERSION
+	for old in glob.glob(glob.escape(name)+'.*'):
+		if not old[:-4]==cache_file:
+			os.remove(old)
+	table={}
+	end=0	#THE LENGTH OF THE DATA REFERRED TO BY THE VALID ENTRIES
+	valid=0	#THE LENGTH OF THE VALID ENTRIES OF THE TABLE OF CONTENTS
+	size=0
+	if os.path.exists(cache_file+'.dat'):
+		size=os.path.getsize(cache_file+'.dat')
+	if os.path.exists(cache_file+'.idx'):
+		for line in open(cache_file+'.idx','rb'):
+			entry=line.decode('utf-8').rstrip('\n').split('\t')
+			if len(entry)!=5 or not line.endswith(b'\n'):
+				break	#AN ENTRY CUT SHORT BY AN INTERRUPTED RUN
+			offset,wl,sl=int(entry[2]),int(entry[3]),int(entry[4])
+			if offset!=end or offset+wl+sl>size:
+				break	#THE DATA OF THIS ENTRY WAS NOT WRITTEN BEFORE THE RUN WAS INTERRUPTED
+			table[entry[0]]=[entry[1],offset,wl,sl]
+			end=offset+wl+sl
+			valid=valid+len(line)
+		os.truncate(cache_file+'.idx',valid)
+	df=open(cache_file+'.dat','ab')
+	df.truncate(end)
+	df.seek(end)
+	map=None
+	if end>0:
+		rf=open(cache_file+'.dat','rb')
+		map=mmap.mmap(rf.fileno(),end,access=mmap.ACCESS_READ)
+		rf.close()
+	tf=open(cache_file+'.idx','a',encoding='utf-8')
+	return {'table':table,'map':map,'data':df,'toc':tf}
+
+# TOKENDIGEST returns a digest of the title, subtitle and text of an article, which
+# changes whenever the article has to be tokenized again.
+def tokendigest(article):
+	import hashlib
+	id,medium,date,title,subtitle,text=article
+	h=hashlib.blake2b(digest_size=12)
+	for field in [title,subtitle,text]:
+		if field==None:
+			field=''
+		h.update(field.encode('utf-8','surrogatepass'))
+		h.update(b'\0')
+	return h.hexdigest()
+
+# GETTOKENS returns the words (and if offsets=1, the spans) of an article from the token
+# cache, as returned by TOKENARTICLE, or None if the article is not in the cache, has
+# changed, or was cached without spans.
+def gettokens(cache,article,offsets=0):
+	from array import array
+	entry=cache['table'].get(str(article[0]))
+	if entry==None or entry[0]!=tokendigest(article):
+		return None
+	digest,offset,wl,sl=entry
+	if offsets==1 and sl==0:
+		return None
+	if cache['map']==None or offset+wl+sl>len(cache['map']):	#APPENDED AFTER THE CACHE WAS OPENED
+		return None
+	twords,swords,awords=str(cache['map'][offset:offset+wl],'utf-8','surrogatepass').split('\n')
+	twords,swords,awords=twords.split(' '),swords.split(' '),awords.split(' ')
+	if offsets==0:
+		return [twords,None,swords,None,awords,None]
+	spans=array('I')
+	spans.frombytes(cache['map'][offset+wl:offset+wl+sl])
+	spans=[[spans[i],spans[i+1]] for i in range(0,len(spans),2)]
+	t,s=len(twords),len(twords)+len(swords)
+	return [twords,spans[:t],swords,spans[t:s],awords,spans[s:]]
+
+# PUTTOKENS appends the words (and spans, if any) of an article, as returned by
+# TOKENARTICLE, to the token cache, unless they are already cached.
+def puttokens(cache,article,tokens):
+	from array import array
+	id=str(article[0])
+	if '\t' in id or '\n' in id:
+		return
+	twords,tspans,swords,sspans,awords,aspans=tokens
+	digest=tokendigest(article)
+	entry=cache['table'].get(id)
+	if entry!=None and entry[0]==digest and (entry[3]>0 or tspans==None):
+		return
+	words='\n'.join([' '.join(twords),' '.join(swords),' '.join(awords)]).encode('utf-8','surrogatepass')
+	spans=b''
+	if tspans!=None:
+		spans=array('I',[o for span in tspans+sspans+aspans for o in span]).tobytes()
+	offset=cache['data'].tell()
+	cache['data'].write(words+spans)
+	cache['toc'].write(id+'\t'+digest+'\t'+str(offset)+'\t'+str(len(words))+'\t'+str(len(spans))+'\n')
+	cache['table'][id]=[digest,offset,len(words),len(spans)]
+
+# CLOSETOKENCACHE writes the articles added to the token cache to disk.
+def closetokencache(cache):
+	cache['data'].close()	#THE DATA IS WRITTEN BEFORE THE TABLE OF CONTENTS REFERS TO IT
+	cache['toc'].close()
+	if cache['map']!=None:
+		cache['map'].close()
+
+# CODEARTICLESET codes an article with each of the dictionaries whose numbers are listed
+# in ds, and returns the results of CODEARTICLE in the same order. The article is only
+# tokenized once for all dictionaries of the same language, and the lists of words
+# returned for these dictionaries are the same. If token caches (see OPENTOKENCACHE)
+# are passed on for a language, the words are taken from the cache where possible.
+def codearticleset(article,ds,dicts,indexes,langs,adjacent=0,offsets=0,profiles=None,caches=None):
+	tokens={}
+	coded=[]
+	for d in ds:
+		if not langs[d] in tokens:
+			if caches!=None and langs[d] in caches:
+				tokens[langs[d]]=gettokens(caches[langs[d]],article,offsets)
+			if tokens.get(langs[d])==None:
+				tokens[langs[d]]=tokenarticle(article,langs[d],offsets)
+		profile=None
+		if profiles!=None:
+			profile=profiles[d]
+		coded.append(codearticle(article,dicts[d],langs[d],adjacent,indexes[d],offsets,profile,tokens[langs[d]]))
+	return coded
+
+# CODEARTICLES codes a stream of [<article>, <list of dictionary numbers>] pairs, using
+# the dictionaries, indexes (obtained from INDEXDICT) and languages listed under these
+# numbers, and yields [<article>, <list of dictionary numbers>, <results of CODEARTICLESET>]
+# in the same order.
+# If workers>1, the articles are coded in batches by a pool of worker processes, which
+# receive the dictionaries only once, when they are started. At most two batches per
+# worker are kept waiting, so memory use does not grow with the number of articles.
+# Worker processes are forked, so this requires a system supporting fork (Linux, macOS).
+# If profiles (one per dictionary) are passed on, the coding is recorded in them (see
+# PROFILEADD); the workers return their records with each batch.
+# If token caches (one per language, see OPENTOKENCACHE) are passed on, the words are
+# taken from them where possible, and the words of all other articles are added to them.
+# The workers only read the caches; all articles are added by the calling process.
+def codearticles(stream,dicts,indexes,langs,adjacent=0,workers=1,batchsize=20,offsets=0,profiles=None,caches=None):
+	import multiprocessing
+	from collections import deque
+	if workers<=1:
+		for article,ds in stream:
+			coded=codearticleset(article,ds,dicts,indexes,langs,adjacent,offsets,profiles,caches)
+			cachearticle(caches,article,ds,langs,coded)
+			yield [article,ds,coded]
+		return
+	profiling=0
+	if profiles!=None:
+		profiling=1
+	pool=multiprocessing.get_context('fork').Pool(workers,initializer=initworker,initargs=(dicts,indexes,langs,adjacent,offsets,profiling,caches))
+	try:
+		pending=deque()
+		batch=[]
+		for item in stream:
+			batch.append(item)
+			if len(batch)==batchsize:
+				pending.append([batch,pool.apply_async(codebatch,(batch,))])
+				batch=[]
+			while len(pending)>=2*workers:
+				batch_done,result=pending.popleft()
+				coded_batch,batch_profiles=result.get()
+				if profiles!=None:
+					for d in range(len(profiles)):
+						profilemerge(profiles[d],batch_profiles[d])
+				for item_done,coded in zip(batch_done,coded_batch):
+					cachearticle(caches,item_done[0],item_done[1],langs,coded)
+					yield item_done+[coded]
+		if len(batch)>0:
+			pending.append([batch,pool.apply_async(codebatch,(batch,))])
+		while len(pending)>0:
+			batch_done,result=pending.popleft()
+			coded_batch,batch_profiles=result.get()
+			if profiles!=None:
+				for d in range(len(profiles)):
+					profilemerge(profiles[d],batch_profiles[d])
+			for item_done,coded in zip(batch_done,coded_batch):
+				cachearticle(caches,item_done[0],item_done[1],langs,coded)
+				yield item_done+[coded]
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+# CACHEARTICLE adds the words of an article coded by CODEARTICLESET to the token caches
+# of its languages (if any), taking them from the results of the first dictionary of
+# each language.
+def cachearticle(caches,article,ds,langs,coded):
+	if caches==None:
+		return
+	for k in range(len(ds)):
+		if langs[ds[k]] in caches:
+			c=coded[k]
+			if len(c)>6:
+				puttokens(caches[langs[ds[k]]],article,[c[0],c[6],c[2],c[7],c[4],c[8]])
+			else:
+				puttokens(caches[langs[ds[k]]],article,[c[0],None,c[2],None,c[4],None])
+
+# INITWORKER stores the dictionaries in a worker process started by CODEARTICLES.
+WORKER={}
+def initworker(dicts,indexes,langs,adjacent,offsets=0,profiling=0,caches=None):
+	WORKER['dicts']=dicts
+	WORKER['indexes']=indexes
+	WORKER['langs']=langs
+	WORKER['adjacent']=adjacent
+	WORKER['offsets']=offsets
+	WORKER['profiling']=profiling
+	WORKER['caches']=caches
+
+# CODEBATCH codes a batch of [<article>, <list of dictionary numbers>] pairs in a worker
+# process started by CODEARTICLES, and returns the results of CODEARTICLESET, together
+# with the profiles of the batch (one per dictionary), or None if the coding is not
+# profiled.
+def codebatch(batch):
+	coded=[]
+	profiles=None
+	if WORKER['profiling']==1:
+		profiles=[{} for d in WORKER['dicts']]
+	for article,ds in batch:
+		coded.append(codearticleset(article,ds,WORKER['dicts'],WORKER['indexes'],WORKER['langs'],WORKER['adjacent'],WORKER['offsets'],profiles,WORKER['caches']))
+	return [coded,profiles]
 
 # The following functions operate on the list of recognized concepts, and serve to
 # generate specific kinds of output.
@@ -904,8 +1892,21 @@ IF IT WAS AN 'AND' BRACKET, THE no# CRITERION IS KEPT AT ZERO AND THE TEST CONTI
 # the query '101	Think		think*_n(pad~2)\r\n102	Myself		I'
 # JCODE will return three hits [[0,'102'],[1,'101'],[4,'102']]
 # resulting in the text 'I(Myself) think(Think), therefore I(Myself) am confused.'.
-def e_annotate(words,found,dict):
+# If the raw text and the spans of its words obtained from LEXWORDS are given, the
+# brackets are inserted into the raw text instead, whose whitespace is collapsed.
+def e_annotate(words,found,dict,raw=None,spans=None):
 	import re
+	if spans!=None:
+		if raw==None:
+			raw=''
+		text=''
+		last=0
+		for hit in found:
+			end=spans[hit[0]][1]
+			text=text+raw[last:end]+'('+dict[hit[1]]+')'
+			last=end
+		text=text+raw[last:]
+		return re.sub(r'\s+',' ',text).strip()
 	text=''
 	for w in range(len(words)):
 		word=words[w]+' '
@@ -945,21 +1946,200 @@ def e_replace(found):
 # ['102', 'Myself', '', 'I', 'think,'] for the first hit (note, the comma counts as one word)
 # ['101', 'Think', 'I', 'think', ', therefore'] for the second hit
 # ['102', 'Myself', ', therefore', 'I', 'am confused'] for the third hit.
-def e_kwic(hit,b,words,dict):
+# If the raw text and the spans of its words obtained from LEXWORDS are given, the
+# keyword and its context are sliced from the raw text instead, with whitespace
+# collapsed and commas replaced by spaces.
+def e_kwic(hit,b,words,dict,raw=None,spans=None):
 	kw=words[hit[0]]
 	if hit[0]<b:
 		a=0
 	else:
 		a=hit[0]-b
-	before=''
-	for p in range(hit[0]-a):
-		before=before+words[a+p]+' '
 	if hit[0]+b+1>len(words):
 		o=len(words)-2
 	else:
 		o=hit[0]+b
+	if spans!=None:
+		if raw==None:
+			raw=''
+		start,end=spans[hit[0]]
+		before=raw[spans[a][0]:start]
+		kw=raw[start:end]
+		after=''
+		if o>hit[0]:
+			after=raw[end:spans[o][1]]
+		before,kw,after=[' '.join(part.replace(',',' ').split()) for part in [before,kw,after]]
+		return [hit[1],dict[hit[1]],before,kw,after]
+	before=''
+	for p in range(hit[0]-a):
+		before=before+words[a+p]+' '
 	after=''
 	for p in range(o-hit[0]):
 		after=after+words[hit[0]+p+1]+' '
 	kwic=[hit[1],dict[hit[1]],before,kw,after]
-	return kwic
\ No newline at end of file
+	return kwic
+
+# COOCCURRENCES determines the weighted cooccurrences between the concepts recognized
+# in one document, given as a list of [<word position>, <concept id>] in the order of
+# the results file, where word positions are prefixed 't' for title, 's' for subtitle,
+# 'a' for article. Subtitle positions are counted after the title, with a gap of ten
+# words per recognized subtitle concept.
+# Concepts within a window of distance words cooccur with a weight discounted by
+# their cubic distance; concepts in the title and subtitle also cooccur with all
+# concepts in the text, weighted by the squareroot of the frequency of that concept
+# divided by the squareroot of the number of all concepts recognized in the text
+# (see JCOOC).
+# It returns a dictionary {(<concept id>, <concept id>): <weight>}, listing each pair
+# in the order of its first cooccurrence, and each pair from the smaller to the larger
+# concept id.
+def cooccurrences(items,distance):
+	from collections import Counter
+	tl=0
+	concepts=[]
+	titleconcepts=[]
+	for e in items:
+		if 't' in e[0]:
+			tl=int(e[0][1:])
+			titleconcepts.append([int(e[0][1:]),e[1]])
+		elif 's' in e[0]:
+			tl=tl+10
+			titleconcepts.append([int(e[0][1:])+tl,e[1]])
+		else:
+			concepts.append([int(e[0][1:]),e[1]])
+	weights={}
+	# windowed cooccurrences: from each concept, the following concepts are visited until
+	# the first one outside of the window
+	for c in range(len(concepts)):
+		d=c+1
+		while d<len(concepts) and concepts[d][0]-concepts[c][0]<distance:
+			if concepts[c][1]!=concepts[d][1]:
+				co=(min(concepts[c][1],concepts[d][1]),max(concepts[c][1],concepts[d][1]))
+				weights[co]=weights.get(co,0)+(distance**3.0-(concepts[d][0]-concepts[c][0]-1)**3.0)/distance**3.0
+			d=d+1
+	textconcepts=Counter([concept[1] for concept in concepts])
+	for c in range(len(titleconcepts)):
+		d=c+1
+		while d<len(titleconcepts) and titleconcepts[d][0]-titleconcepts[c][0]<distance:
+			if titleconcepts[c][1]!=titleconcepts[d][1]:
+				co=(min(titleconcepts[c][1],titleconcepts[d][1]),max(titleconcepts[c][1],titleconcepts[d][1]))
+				weights[co]=weights.get(co,0)+(distance**3.0-(titleconcepts[d][0]-titleconcepts[c][0]-1)**3.0)/distance**3.0
+			d=d+1
+		# title and subtitle concepts cooccur with all concepts in the text
+		for t in textconcepts:
+			if titleconcepts[c][1]!=t:
+				co=(min(titleconcepts[c][1],t),max(titleconcepts[c][1],t))
+				weights[co]=weights.get(co,0)+textconcepts[t]**0.5/len(concepts)**0.5
+	return weights
+
+# The following functions sort output files that may not fit into memory, such as the
+# keywords-in-context file, by external merge sort.
+
+# SORTRUNS starts sorting a sequence of lines without holding it in memory. Lines are
+# collected in sorted runs of at most runsize lines, which are stored in temporary files
+# named <prefix>.run<number>. It returns [<prefix>, <runsize>, <lines>, <run files>,
+# <number of runs written>].
+def sortruns(prefix,runsize=100000):
+	return [prefix,runsize,[],[],0]
+
+# ADDLINE adds a line to the runs obtained from SORTRUNS. Like lines read from a file,
+# it is stripped of surrounding whitespace.
+def addline(runs,line):
+	runs[2].append(line.strip())
+	if len(runs[2])>=runs[1]:
+		writerun(runs)
+
+# WRITERUN sorts the lines collected by ADDLINE and stores them as a run.
+def writerun(runs):
+	import codecs
+	runs[2].sort()
+	runfile=runs[0]+'.run'+str(runs[4])
+	ro=codecs.open(runfile,'w',encoding='utf-8')
+	for line in runs[2]:
+		ro.write(line+'\n')
+	ro.close()
+	runs[3].append(runfile)
+	runs[4]=runs[4]+1
+	runs[2]=[]
+
+# MERGERUNS merges the runs obtained from SORTRUNS/ADDLINE into one sorted file (see
+# ITERRUNS).
+def mergeruns(runs,filename,fanin=100):
+	import codecs
+	fo=codecs.open(filename,'w',encoding='utf-8')
+	for line in iterruns(runs,fanin):
+		fo.write(line+'\n')
+	fo.close()
+
+# ITERRUNS yields the lines collected in the runs obtained from SORTRUNS/ADDLINE in
+# sorted order, reading one line of each run at a time, and removes the temporary run
+# files. At most fanin runs are opened at once; if there are more, they are first
+# merged into larger runs.
+def iterruns(runs,fanin=100):
+	import codecs
+	if len(runs[3])==0:	#ALL LINES FIT INTO ONE RUN
+		runs[2].sort()
+		lines=runs[2]
+		runs[2]=[]
+		for line in lines:
+			yield line
+		return
+	if len(runs[2])>0:
+		writerun(runs)
+	while len(runs[3])>fanin:
+		runfile=runs[0]+'.run'+str(runs[4])
+		ro=codecs.open(runfile,'w',encoding='utf-8')
+		for line in mergefiles(runs[3][:fanin]):
+			ro.write(line+'\n')
+		ro.close()
+		runs[3]=runs[3][fanin:]+[runfile]
+		runs[4]=runs[4]+1
+	sortedfiles=runs[3]
+	runs[3]=[]
+	for line in mergefiles(sortedfiles):
+		yield line
+
+# MERGEFILES yields the lines of several sorted files in sorted order, and removes
+# the files once all lines have been read.
+def mergefiles(sortedfiles):
+	import heapq, os
+	files=[open(sortedfile,encoding='utf-8',newline='\n') for sortedfile in sortedfiles]
+	for line in heapq.merge(*[(line[:-1] for line in f) for f in files]):
+		yield line
+	for f in files:
+		f.close()
+	for sortedfile in sortedfiles:
+		os.remove(sortedfile)
+
+# The following functions keep a journal of the output written by the coding script,
+# such that an interrupted run can be resumed where it stopped.
+# SYNCFILE writes everything written to an output file so far to the disk.
+def syncfile(f):
+	import os
+	f.flush()
+	os.fsync(f.fileno())
+
+# WRITEJOURNAL stores a list of [<key>, <value>] pairs in a journal file. The journal
+# is first written to a temporary file that then replaces the old journal, such that
+# an interruption leaves either the old or the new journal complete.
+def writejournal(filename,journal):
+	import codecs, os
+	jo=codecs.open(filename+'.tmp','w',encoding='utf-8')
+	for key,value in journal:
+		jo.write(key+','+str(value)+'\n')
+	syncfile(jo)
+	jo.close()
+	os.replace(filename+'.tmp',filename)
+
+# READJOURNAL returns the pairs stored by WRITEJOURNAL as a dictionary of strings,
+# or None if there is no journal.
+def readjournal(filename):
+	import codecs, os
+	if not os.path.exists(filename):
+		return None
+	journal={}
+	ji=codecs.open(filename,'r',encoding='utf-8')
+	for line in ji:
+		key,value=line.rstrip('\n').split(',',1)
+		journal[key]=value
+	ji.close()
+	return journal
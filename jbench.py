@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###########################################################################
+#                                                                         #
+#                           (c) Christian Baden                           #
+#             The Hebrew University of Jerusalem, Israel, 2023            #
+#                                                                         #
+# Please cite as:                                                         #
+#        Baden, Christian (2023). Jamcode: A syntax and Python script for #
+#        syntax-sensitive, context-disambiguated, dictionary-based        #
+#        textual analysis. Available Online:                              #
+#        https://github.com/christianbaden/jamcode                        #
+#                                                                         #
+# This script is built for use in conjunction with the AmCAT free & open  #
+# source infrastructure for large-scale text analysis for the social      #
+# sciences & humanities https://amcat.nl, and specifially, the Jerusalem  #
+# AmCAT Server http://jamcat.mscc.huji.ac.il                              #
+#                                                                         #
+# JBENCH is the JAmCAT benchmark script, which times the library JAMCODE  #
+# on synthetic texts and dictionaries. It does not access any server.     #
+#                                                                         #
+# JAmCAT and the JCODE/JAMCODE coding script have been developed by       #
+# INFOCORE (In)Forming Conflict Prevention, Response and Resolution:      #
+#        The Role of Media in Violent Conflict                            #
+#        Funded by the European Union FP7 (Cooperation), Grant Nr. 613308 #
+#        http://www.infocore.eu/                                          #
+# and                                                                     #
+# RECORD Frame Justification and Resonance in Conflict-Related Discourse  #
+#        Funded by the European Union FP7 (Marie Curie), Grant Nr. 627682 #
+#        http://www.frame-resonance.eu/                                   #
+#                                                                         #
+# For an example of a dictionary that can be applied using Jamcode,       #
+# please see the INFOCORE Dictionary, a multilingual dictionary for       #
+# automatically analyzing conflict-related discourse:                     #
+#        Baden, Christian, Jungblut, Marc, Micevski, Igor, Stalpouskaya,  #
+#        Katsiaryna, Tenenboim-Weinblatt, Keren, Berganza Conde, Rosa,    #
+#        Dimitrakopoulou, Dimitra, & Fröhlich, Romy (2018). The INFOCORE  #
+#        Dictionary. Available Online:                                    #
+#        https://osf.io/f5u8h/                                            #
+#        https://github.com/christianbaden/INFOCORE                       #
+#                                                                         #
+# Jamcode is free and open software: you can redistribute it and/or       #
+# modify it under the terms of the GNU Lesser General Public License as   #
+# published by the Free Software Foundation, either version 3 of the      #
+# License, or (at your option) any later version.                         #
+#                                                                         #
+# It is distributed in the hope that it will be useful, but WITHOUT       #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or   #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public     #
+# License for more details.                                               #
+#                                                                         #
+###########################################################################
+
+
+# JBENCH generates a synthetic corpus and dictionary for one or several languages,
+# codes the corpus with JAMCODE, and reports the time taken by each step of the coding
+# script JCODE separately, so that changes to a dictionary or to JAMCODE can be compared
+# in speed. The same parameters and seed always generate the same corpus and dictionary.
+#
+# CALL AS:
+# jbench.py <languages> <options>
+#
+# Where:
+# <languages> is one or several languages separated by commas (e.g., "EN,AR,HE"). The
+#   generated words use the Latin alphabet for all languages except Arabic ('AR') and
+#   Hebrew ('HE'), which use their own alphabets and attach prefixes to the words.
+#   Texts in Arabic and Hebrew are coded by JCODE_HA, all others by JCODE.
+# <options> are (all optional):
+# docs <n>: number of documents (default 200)
+# length <n>: number of words per text (default 300); titles have a tenth of this length
+# density <p>: share of the words in the texts that are keywords of the dictionary (default 0.05)
+# concepts <n>: number of concepts in the dictionary (default 100)
+# wildcards <p>: share of the keywords in the dictionary that are truncated (default 0.3)
+# depth <n>: depth of nested brackets in the Boolean criteria of the dictionary (default 2)
+# window <n>: largest word distance of the Boolean criteria, and window width of JCOOC (default 10)
+# repeat <n>: times each step is repeated; the fastest time is reported (default 3)
+# seed <n>: seed of the random generator (default 1)
+#
+# OUTPUT:
+# for each language and step (towords, reading the words from the token cache, jcode or
+# jcode_ha, e_annotate, e_kwic, the term document matrix, and cooccurrences), the time in seconds,
+# and the number of words and recognized concepts processed per second.
+# jcode and jcode_ha are timed twice: starting with an empty vocabulary, as at the start
+# of a run, and again with the vocabulary of all documents ('warm'), as later in a run
+# (see WORDIDS in JAMCODE).
+
+import sys, os
+import random
+import time
+import tempfile
+import shutil
+import codecs
+from jamcode4 import *
+
+ALPHABETS={'AR':'ابتثجحخدذرزسشصضطظعغفقكلمنهوي','HE':'אבגדהוזחטיכלמנסעפצקרשת'}
+PREFIXES={'AR':['و','ال','وال','ب','ل','بال'],'HE':['ו','ה','ב','ל','וה','ש','מ']}
+SUFFIXES=['s','es','ed','ing']
+PUNCT=[', ','. ','? ','! ',': ','\n']
+
+languages=sys.argv[1].split(',')
+options=sys.argv[2:]
+
+# Reads the value following an option, or returns the default
+def option(name,default):
+	if name in options:
+		return type(default)(options[options.index(name)+1])
+	return default
+
+docs=option('docs',200)
+length=option('length',300)
+density=option('density',0.05)
+concepts=option('concepts',100)
+wildcards=option('wildcards',0.3)
+depth=option('depth',2)
+window=option('window',10)
+repeat=option('repeat',3)
+seed=option('seed',1)
+
+# VOCABULARY returns n different random words, written in the alphabet of the language.
+def vocabulary(n,lang,rng):
+	alphabet=ALPHABETS.get(lang,'abcdefghijklmnopqrstuvwxyz')
+	words=[]
+	known=set()
+	while len(words)<n:
+		word=''.join(rng.choice(alphabet) for i in range(rng.randint(3,9)))
+		if word in known:
+			continue
+		known.add(word)
+		words.append(word)
+	return words
+
+# INFLECT adds a prefix (Arabic, Hebrew) or a suffix (other languages) to a word,
+# with a probability of one in four.
+def inflect(word,lang,rng):
+	if rng.random()<0.25:
+		if lang in PREFIXES:
+			return rng.choice(PREFIXES[lang])+word
+		return word+rng.choice(SUFFIXES)
+	return word
+
+# TRUNCATE returns a keyword of the dictionary for a word, which is truncated at the
+# beginning, the end or both with a probability of <wildcards>. At least four letters
+# of the word are kept.
+def truncate(word,rng):
+	if rng.random()>=wildcards or len(word)<6:
+		return word
+	cut=rng.randint(4,len(word)-1)
+	r=rng.random()
+	if r<0.4:
+		return word[:cut]+'*'
+	if r<0.8:
+		return '*'+word[-cut:]
+	return '*'+word[1:cut]+'*'
+
+# BOOLEAN returns a Boolean combination of words with brackets nested up to level d.
+def boolean(words,d,rng):
+	op=rng.choice('&|')
+	parts=[]
+	for i in range(rng.randint(2,3)):
+		if d>0 and rng.random()<0.5:
+			parts.append('('+boolean(words,d-1,rng)+')')
+		else:
+			parts.append(truncate(rng.choice(words),rng))
+	return op.join(parts)
+
+# MAKEDICT returns the lines of a dictionary file with <concepts> concepts, whose
+# keywords are drawn from the last (least frequent) words of the vocabulary, and whose
+# criteria are drawn from all words of the vocabulary.
+def makedict(vocab,keywords,rng):
+	lines=[]
+	for c in range(concepts):
+		phrases=[]
+		for p in range(rng.randint(1,3)):
+			phrase=truncate(rng.choice(vocab[-keywords:]),rng)
+			while rng.random()<0.5:
+				if depth>0 and rng.random()<0.5:
+					crit=boolean(vocab,depth-1,rng)
+				else:
+					crit=truncate(rng.choice(vocab),rng)
+				phrase=phrase+'_'+rng.choice('yn')+'('+crit+'~'+str(rng.randint(1,window))+')'
+			phrases.append(phrase)
+		lines.append(str(1000+c)+'\tconcept '+str(1000+c)+'\t\t'+' '.join(phrases))
+	return lines
+
+# MAKETEXT returns a text of n words, of which a share of <density> are keywords. The
+# other words are drawn from the vocabulary with a frequency falling with their rank.
+def maketext(n,vocab,keywords,cumweights,lang,rng):
+	text=[]
+	for i in range(n):
+		if rng.random()<density:
+			word=rng.choice(vocab[-keywords:])
+		else:
+			word=rng.choices(vocab,cum_weights=cumweights)[0]
+		text.append(inflect(word,lang,rng))
+		if rng.random()<0.1:
+			text.append(rng.choice(PUNCT))
+		else:
+			text.append(' ')
+	return ''.join(text).strip()
+
+# MAKECORPUS returns <docs> articles [<id>, <medium>, <date>, <title>, <subtitle>, <text>]
+# and the lines of a matching dictionary file.
+def makecorpus(lang):
+	rng=random.Random(str(seed)+lang)
+	vocab=vocabulary(5000,lang,rng)
+	keywords=max(1,concepts*2)
+	cumweights=[]
+	total=0
+	for r in range(len(vocab)):
+		total=total+1/(r+1)
+		cumweights.append(total)
+	dictlines=makedict(vocab,keywords,rng)
+	articles=[]
+	for d in range(docs):
+		date='2015-%02d-%02dT00:00:00' % (rng.randint(1,12),rng.randint(1,28))
+		title=maketext(max(1,length//10),vocab,keywords,cumweights,lang,rng)
+		text=maketext(length,vocab,keywords,cumweights,lang,rng)
+		articles.append([str(d+1),'bench',date,title,'',text])
+	return [articles,dictlines]
+
+# TIMED runs a step <repeat> times and returns the fastest time and the result. If
+# setup is given, it is run before each repetition, without being timed.
+def timed(step,setup=None):
+	best=None
+	for r in range(repeat):
+		if setup!=None:
+			setup()
+		start=time.perf_counter()
+		result=step()
+		seconds=time.perf_counter()-start
+		if best==None or seconds<best:
+			best=seconds
+	return [best,result]
+
+# REPORT prints the time of a step, and the number of words and recognized concepts
+# (if any) processed per second.
+def report(lang,name,seconds,tokens,hits=None):
+	line=lang.ljust(4)+name.ljust(14)+('%.3f s' % seconds).rjust(10)+('%d words/s' % (tokens/seconds)).rjust(20)
+	if hits!=None:
+		line=line+('%d hits/s' % (hits/seconds)).rjust(18)
+	print(line)
+
+print('JAMCODE', JAMCODE_VERSION, '-', docs, 'docs of', length, 'words, density', density, '-', concepts, 'concepts, wildcards', wildcards, 'depth', depth, 'window', window, '- seed', seed)
+home=os.getcwd()
+for lang in languages:
+	articles,dictlines=makecorpus(lang)
+	folder=tempfile.mkdtemp(prefix='jbench_')
+	try:
+		os.chdir(folder)
+		di=codecs.open('DICT_bench'+lang+'.txt',mode='w',encoding='utf-8')
+		di.write('\n'.join(dictlines)+'\n')
+		di.close()
+		dict=importdict('bench'+lang,cache=0)
+		index=indexdict(dict,lang)
+		dc={}
+		for d in dict:
+			dc[d[0]]=d[1]
+
+		#TOWORDS
+		def tokenize():
+			return [[towords(article[3],lang),towords(article[5],lang)] for article in articles]
+		seconds,words=timed(tokenize)
+		tokens=sum(len(w[0])+len(w[1]) for w in words)
+		report(lang,'towords',seconds,tokens)
+
+		#TOKEN CACHE
+		cache=opentokencache('bench',lang)
+		for article in articles:
+			puttokens(cache,article,tokenarticle(article,lang))
+		closetokencache(cache)
+		def readcache():
+			cache=opentokencache('bench',lang)
+			cached=[gettokens(cache,article) for article in articles]
+			closetokencache(cache)
+			return cached
+		seconds,result=timed(readcache)
+		report(lang,'tokencache',seconds,tokens)
+
+		#JCODEFIELDS OR JCODEFIELDS_HA
+		def code():
+			found=[]
+			for a in range(len(articles)):
+				if lang=='AR' or lang=='HE':
+					found.append(jcodefields_ha(words[a],dict,articles[a][2],lang,0,index))
+				else:
+					found.append(jcodefields(words[a],dict,articles[a][2],0,index))
+			return found
+		name='jcode'
+		if lang=='AR' or lang=='HE':
+			name='jcode_ha'
+		seconds,found=timed(code,lambda: resetvocabulary(index))	#EACH TIME WITH AN EMPTY VOCABULARY
+		hits=sum(len(f[0])+len(f[1]) for f in found)
+		report(lang,name,seconds,tokens,hits)
+		seconds,found=timed(code)	#WITH THE WORDS OF ALL DOCUMENTS IN THE VOCABULARY
+		report(lang,name+' warm',seconds,tokens,hits)
+
+		#EXPORTERS
+		def annotate():
+			for a in range(len(articles)):
+				e_annotate(words[a][0],found[a][0],dc)
+				e_annotate(words[a][1],found[a][1],dc)
+		seconds,result=timed(annotate)
+		report(lang,'e_annotate',seconds,tokens,hits)
+
+		def kwic():
+			for a in range(len(articles)):
+				for t in range(2):
+					for hit in found[a][t]:
+						e_kwic(hit,5,words[a][t],dc)
+		seconds,result=timed(kwic)
+		report(lang,'e_kwic',seconds,tokens,hits)
+
+		dl=sorted(dc)
+		col={}
+		for i in range(len(dl)):
+			col[dl[i]]=i
+		def tdmatrix():	# as written by JCODE with option s
+			td=codecs.open('td_bench_'+lang+'.txt',mode='w',encoding='utf-8')
+			td.write('id,'+','.join(dl)+'\n')
+			for a in range(len(articles)):
+				counts={}
+				for f in found[a][0]+found[a][1]:
+					counts[col[f[1]]]=counts.get(col[f[1]],0)+1
+				vector=[0]*len(dl)
+				for c in counts:
+					vector[c]=counts[c]
+				td.write(','.join([articles[a][0]]+[str(v) for v in vector])+'\n')
+			td.close()
+		seconds,result=timed(tdmatrix)
+		report(lang,'td matrix',seconds,tokens,hits)
+
+		def cooc():	# as computed by JCODE with option c, and by JCOOC
+			for a in range(len(articles)):
+				items=[]
+				for f in found[a][0]:
+					items.append(['t'+str(f[0]),f[1]])
+				for f in found[a][1]:
+					items.append(['a'+str(f[0]),f[1]])
+				cooccurrences(items,window)
+		seconds,result=timed(cooc)
+		report(lang,'cooccurrences',seconds,tokens,hits)
+	finally:
+		os.chdir(home)
+		shutil.rmtree(folder)
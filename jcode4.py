@@ -75,24 +75,57 @@
 #   searches for a file called 'lang_index_<index>.csv'
 #   in the python folder, wherein each line <document id>,<dictionary name> specifies
 #   which out of multiple dictionaries is to be used for each document.
+#   Several dictionary names can be separated by commas (e.g., "EN,ACTORS_EN,FRAMES_EN"). In this case, each text is tokenized only once (per language),
+#   all dictionaries are applied to it, and the output files are written separately for each dictionary, named after it. The files concerning the
+#   run as a whole (journal, manifest and profile) are named after all dictionaries joined by '+' (e.g., manifest_<index>_EN+ACTORS_EN+FRAMES_EN.txt).
 # <options> are:
 # s OR e (required): style of the term document matrix:
 #                    s=simple: first row states concept ids, not names; first column states document ids
 #                    e=extended: first two rows state concept ids and concept names; first columns state the document id, date, and medium
+# m (optional): m=sparse matrix, writes the term document matrix in the sparse Matrix Market format instead, which only lists the non-zero counts (see OUTPUT)
 # a (optional): a=annotated, generates an optional additional output file, which contains each raw text annotated for all recognized concept names (see JAMCODE for details; warning, slows down the script considerably and generates big files)
 # r (optional): r=replaced, generates an optional additional output file, which contains, for each document, one line stating the document id followed by the sequence of all concept ids recognized in this document (see JAMCODE for details)
 # k (optional): k=keywords-in-context, generates an optional additional output file, which lists, for each concept, all found instances within their original context
 #               PLEASE NOTE: By default, this option includes up to five words before and after a coded concept. If the option k is followed by a number, that word distance will be used instead (e.g., "k 10" will use a word distance of 10)
+# c <window width> (optional): c=cooccurrences, generates an optional additional output file, which lists the weighted cooccurrences between the concepts recognized in each document, within the given window width (e.g., "c 10"), as computed by JCOOC
+# o (optional): o=original text, the annotated and keywords-in-context output files quote the raw texts, rather than the cleaned up words recognized by JAMCODE
 # j (optional): j=adjacent codes permitted: By default, JCODE only records successive instances of the same code if these are separated either by at least five words, or a different code. This is to prevent overlapping coding criteria from registering multiple matches in multi-word expressions multiple times.
 #               The option switches off this restraint, such that all matching instances are recorded even if they are adjacent.
+# p (optional): p=profile, records for each codephrase of the dictionary how often it was tested and matched, and how much time this took, and writes a report ranking the codephrases by time (see OUTPUT)
+#               PLEASE NOTE: This option slows down the coding. With the option workers, the times add up the time spent in all worker processes.
+# workers <n> (optional): codes the documents in <n> parallel worker processes (e.g., "workers 8"). All output files are written in the same order as without this option.
+# source <file> (optional): reads the documents from a local file instead of the AmCAT server (e.g., "source corpus.jsonl" or "source file:corpus.jsonl"), such as an export of the index.
+#               The file can be in JSON lines (.jsonl), CSV (.csv) or Parquet (.parquet) format, with the same fields as the documents on the server (see ITERFILE in JAMCODE).
+#               <index> is then only used to name the output files.
+# tokens (optional): keeps the words of all coded texts in a token cache per language in the folder jamcode_cache (see OPENTOKENCACHE in JAMCODE), so that later runs
+#               on the same index (e.g., with a revised dictionary) need not clean up and split the texts again. Texts that have changed since they were cached, and all texts
+#               after a change of the tokenizer of JAMCODE, are split again.
 # from<document id> (optional): commences the coding not from the first document in the set, but the first with an id larger than the specified number.
+# resume (optional): continues an interrupted run with the same options. While coding, JCODE records the output written so far in a journal file
+#                    journal_<index>_<dictionary name>.txt every 100 documents (or every <n> documents, if the option "checkpoint <n>" is given). On resume, all output
+#                    written after the last journal entry is discarded, the documents already coded are skipped, and the coding continues from there.
+#                    Once the run is complete, the journal is kept as the manifest (see option update).
+# update (optional): codes only the documents added to the index since the last complete run with the same options, and appends them to its output files.
+#                    JCODE recognizes the coded documents by the manifest manifest_<index>_<dictionary name>.txt and the list of their ids manifest_<index>_<dictionary name>_ids.txt.
+#                    If the dictionary file (or JAMCODE) has changed since, all documents are coded again. Documents that were changed on the server after being coded are not coded again.
 #
 # OUTPUT:
 # results_<index>_<dictionary name>.txt
 # file contents: <document id>,<word position>,<concept id>
 # where word positions are prefixed 't' for title, 's' for subtitle, 'a' for article
+# cooccurrences_<index>_<dictionary name>.txt (option c)
+# file contents: <document id>,<concept id>,<concept id>,<weight> (see JCOOC)
+# td_<index>_<dictionary name>.txt (options s, e)
+# file contents: one row per document, one column per concept, stating the number of times the concept was recognized
+# td_<index>_<dictionary name>.mtx (option m)
+# file contents: the same matrix in Matrix Market coordinate format: <row> <column> <count> for non-zero counts only, numbered from 1
+# the labels of the rows and columns are listed in td_<index>_<dictionary name>_rows.txt (<document id>, or with option e <document id>,<medium>,<date>)
+# and td_<index>_<dictionary name>_cols.txt (<concept id>,<concept name>)
+# profile_<index>_<dictionary name>.txt (option p)
+# file contents: one line per codephrase, ranked by time: <rank>,<dictionary>,<concept id>,<concept name>,<keyword>,<number of criteria>,<widest window>,
+# <times tested for a word>,<keyword hits>,<criterion evaluations>,<matches>,<seconds>,<share of time>
 
-import sys
+import sys, os
 from jamcode4 import *
 import codecs
 
@@ -109,8 +142,11 @@ annotation=0
 replaced=0
 simpletd=0
 elaboratetd=0
+sparsetd=0
 kwics=0
 adjacent=0
+original=0
+cooc=0
 b=5	# bandwidth parameter for the Keywords-in-Context output file, if selected: number of words left and right of the recognized concept
 if 'a' in options:
 	annotation=1
@@ -127,10 +163,41 @@ if 's' in options:
 	simpletd=1
 elif 'e' in options:
 	elaboratetd=1
+if 'm' in options:
+	sparsetd=1
 if 'j' in options:
 	adjacent=1
-	
-texts=gettexts(index,startfrom)
+if 'o' in options:
+	original=1
+profiling=0
+if 'p' in options:
+	profiling=1
+if 'c' in options:
+	cooc=1
+	try:
+		window=int(options[options.index('c')+1])
+	except (IndexError,ValueError):
+		window=0
+	if window<1:
+		sys.exit('option c requires a window width of at least 1 word (e.g., "c 10")')
+workers=1
+if 'workers' in options:
+	workers=int(options[options.index('workers')+1])
+checkpoint=100	# number of documents coded between two entries in the journal
+if 'checkpoint' in options:
+	checkpoint=int(options[options.index('checkpoint')+1])
+tokencache=0
+if 'tokens' in options:
+	tokencache=1
+
+source=None
+if 'source' in options:
+	source=options[options.index('source')+1]
+	if source.startswith('file:'):
+		source=source[5:]
+	total=countfile(source)
+else:
+	total=counttexts(index)
 
 languages=[]
 if dictionary=='INDEX':
@@ -146,166 +213,330 @@ if dictionary=='INDEX':
 			languages.append(language)
 	li.close()
 else:
-	languages.append(dictionary)
+	languages=dictionary.split(',')	# several dictionaries are all applied to each document
+run=dictionary.replace(',','+')	# names the files that belong to the run as a whole
 
 dicts=[]
+indexes=[]
 for language in languages:
 	dict=importdict(language)
 	dicts.append(dict)
+	indexes.append(indexdict(dict,language[-2:]))
+
+# OUTPUTSET returns the set of output files of a dictionary (in INDEX mode, of all
+# dictionaries), which is filled in below, with the concepts of the dictionary:
+# dc (<concept id>: <concept name>), dl (the ordered concept ids), and col (the column
+# of each concept id in the term document matrix).
+def outputset(name,dict):
+	dc={}
+	dl=[]
+	for d in dict:
+		if d[0] in dc:
+			continue
+		else:
+			dl.append(d[0])
+			dc[d[0]]=d[1]
+	dl.sort()
+	col={}
+	for i in range(len(dl)):
+		col[dl[i]]=i
+	return {'name':name,'dc':dc,'dl':dl,'col':col}
 
-dc={}
-dl=[]
-for d in dicts[0]:
-	if d[0] in dl:
-		continue
+sets=[]
+if dictionary=='INDEX':
+	sets.append(outputset(dictionary,dicts[0]))
+else:
+	for d in range(len(languages)):
+		sets.append(outputset(languages[d],dicts[d]))
+
+# The journal records the state of the output files during a run. Once the run is
+# complete, it is kept as the manifest, from which a later run can continue.
+journalfile='journal_'+index+'_'+run+'.txt'
+manifestfile='manifest_'+index+'_'+run+'.txt'
+dichash='-'.join([dicthash('DICT_'+language+'.txt') for language in languages])
+journal=None
+coded=0	# number of documents coded in earlier runs
+progress=0
+if 'resume' in options:
+	journal=readjournal(journalfile)
+	if journal==None:
+		print('no journal found, starting from the first document...')
 	else:
-		dl.append(d[0])
-		dc[d[0]]=d[1]
-dl.sort()
-
-rl=codecs.open('results_'+index+'_'+str(dictionary)+'.txt',mode='w',encoding='utf-8')
-if annotation==1:
-	ea=codecs.open('annotated_'+index+'_'+str(dictionary)+'.txt',mode='w',encoding='utf-8')
-if replaced==1:
-	er=codecs.open('replaced_'+index+'_'+str(dictionary)+'.txt',mode='w',encoding='utf-8')
-if kwics==1:
-	kw=codecs.open('kwic_'+index+'_'+str(dictionary)+'.txt',mode='w',encoding='utf-8')
-if simpletd==1 or elaboratetd==1:
-	td=codecs.open('td_'+index+'_'+str(dictionary)+'.txt',mode='w',encoding='utf-8')
-
-	if simpletd==1:
-		tdhead='id,'
-		for item in dl:
-			tdhead=tdhead+item+','
-		td.write(tdhead[:-1]+'\n')
+		print('resuming after document',journal['id']+'...')
+		coded=int(journal['coded'])
+		progress=int(journal['progress'])
+if 'update' in options and journal==None:
+	journal=readjournal(manifestfile)
+	if journal==None:
+		print('no manifest found, coding all documents...')
+	elif journal['dictionary']!=dichash:
+		print('the dictionary has changed, coding all documents...')
+		journal=None
+	else:
+		coded=int(journal['coded'])+int(journal['progress'])
+		print('adding to', coded, 'documents coded before...')
+if journal!=None and journal['dictionary']!=dichash:
+	sys.exit('cannot resume: the dictionary has changed')
+if total and coded>0:
+	total=total-coded
 
-	if elaboratetd==1:
-		tdhead1=',,,'
-		tdhead2='id,medium,date,'
+profiles=None
+if profiling==1:
+	profiles=[{} for d in dicts]
+
+caches=None
+if tokencache==1:
+	caches={}
+	for language in languages:
+		if not language[-2:] in caches:
+			caches[language[-2:]]=opentokencache(index,language[-2:])
+
+# OPENOUTPUT opens an output file and registers it for the journal. When resuming,
+# the file is continued; it is cut back to the length recorded in the journal below,
+# once all output files have been found in the journal. A fresh file is started anew.
+outputs=[]
+cuts=[]
+def openoutput(filename,fresh=0):
+	if journal!=None and not 'file:'+filename in journal:
+		sys.exit('cannot resume: the interrupted run was started with different options')
+	if journal==None or fresh==1:
+		f=codecs.open(filename,mode='w',encoding='utf-8')
+	else:
+		f=codecs.open(filename,mode='r+',encoding='utf-8')
+		cuts.append([f,int(journal['file:'+filename])])
+	outputs.append([filename,f])
+	return f
+
+ids=openoutput('manifest_'+index+'_'+run+'_ids.txt')	# the ids of all coded documents
+done=None
+if coded>0:
+	done=set()
+	di=codecs.open('manifest_'+index+'_'+run+'_ids.txt',encoding='utf-8')
+	for line in di:
+		if len(done)==coded:
+			break
+		done.add(line.strip())
+	di.close()
+tdhead='%%MatrixMarket matrix coordinate integer general\n'
+tdsize=len(tdhead)	# the size line is only known at the end: a blank line is reserved for it
+for s in sets:
+	name=s['name']
+	dc,dl=s['dc'],s['dl']
+	s['rl']=openoutput('results_'+index+'_'+name+'.txt')
+	if annotation==1:
+		s['ea']=openoutput('annotated_'+index+'_'+name+'.txt')
+	if replaced==1:
+		s['er']=openoutput('replaced_'+index+'_'+name+'.txt')
+	if cooc==1:
+		s['co']=openoutput('cooccurrences_'+index+'_'+name+'.txt')
+	if kwics==1:
+		s['kwicfile']='kwic_'+index+'_'+name+'.txt'
+		s['kl']=openoutput(s['kwicfile']+'.lines',journal!=None and progress==0)	# unsorted, sorted at the end; anew if no lines were written yet in this run
+	if sparsetd==1:
+		s['td']=openoutput('td_'+index+'_'+name+'.mtx')
+		s['tdrows']=0
+		s['tdentries']=0
+		if journal==None:
+			s['td'].write(tdhead)
+			s['td'].write(' '*63+'\n')
+		else:
+			s['tdrows']=int(journal['tdrows:'+name])
+			s['tdentries']=int(journal['tdentries:'+name])
+		s['tr']=openoutput('td_'+index+'_'+name+'_rows.txt')
+		tc=codecs.open('td_'+index+'_'+name+'_cols.txt',mode='w',encoding='utf-8')
 		for item in dl:
-			tdhead1=tdhead1+dc[item].replace(',',' ')+','
-			tdhead2=tdhead2+item+','
-		td.write(tdhead1[:-1]+'\n'+tdhead2[:-1]+'\n')
+			tc.write(item+','+dc[item].replace(',',' ')+'\n')
+		tc.close()
+	elif simpletd==1 or elaboratetd==1:
+		s['td']=openoutput('td_'+index+'_'+name+'.txt')
 
-progress=0
-for article in texts:
+		if simpletd==1 and journal==None:
+			tdhead1='id,'
+			for item in dl:
+				tdhead1=tdhead1+item+','
+			s['td'].write(tdhead1[:-1]+'\n')
+
+		if elaboratetd==1 and journal==None:
+			tdhead1=',,,'
+			tdhead2='id,medium,date,'
+			for item in dl:
+				tdhead1=tdhead1+dc[item].replace(',',' ')+','
+				tdhead2=tdhead2+item+','
+			s['td'].write(tdhead1[:-1]+'\n'+tdhead2[:-1]+'\n')
+
+if journal!=None:	# the interrupted run must have written the same output files
+	if sorted(['file:'+output[0] for output in outputs])!=sorted([key for key in journal if key.startswith('file:')]):
+		sys.exit('cannot resume: the interrupted run was started with different options')
+	for f,length in cuts:
+		f.truncate(length)
+		f.seek(0,2)
+
+# RECORD flushes all output files and records their lengths in the journal, together
+# with the last document coded.
+def record(id,progress):
+	entries=[['id',id],['progress',progress],['coded',coded],['dictionary',dichash]]
+	for filename,f in outputs:
+		syncfile(f)
+		entries.append(['file:'+filename,f.tell()])
+	if sparsetd==1:
+		for s in sets:
+			entries.append(['tdrows:'+s['name'],s['tdrows']])
+			entries.append(['tdentries:'+s['name'],s['tdentries']])
+	writejournal(journalfile,entries)
+
+# Pairs each article with the numbers of the dictionaries to be applied to it
+def withdict(articles):
+	alldicts=list(range(len(languages)))
+	for article in articles:
+		if dictionary=='INDEX':
+			yield [article,[languages.index(lang_index[str(article[0])])]]
+		else:
+			yield [article,alldicts]
+
+lastid=None
+if progress>0:
+	lastid=journal['id']
+id=lastid
+if source==None:
+	texts=itertexts(index,startfrom,progress,lastid,done)
+else:
+	texts=iterfile(source,startfrom,progress,lastid,done)
+for article,ds,codings in codearticles(withdict(texts),dicts,indexes,[l[-2:] for l in languages],adjacent,workers,offsets=original,profiles=profiles,caches=caches):
 	progress=progress+1
 	id,medium,date,title,subtitle,text=article
 	if dictionary=='INDEX':
-		art_lang=lang_index[str(id)]
-		art_dict=dicts[languages.index(art_lang)]
+		art_lang=languages[ds[0]]
 	else:
 		art_lang=dictionary
-		art_dict=dicts[0]
-	
-	tfound=[]
-	sfound=[]
-	afound=[]
-	print(str(round(progress*100/len(texts),1))+'%', id, art_lang, end=" ")
-	
-	if art_lang.endswith('AR') or art_lang.endswith('HE'):
-		twords=towords(title,art_lang[-2:])
-		tfound=jcode_ha(twords,art_dict,date,art_lang[-2:],adjacent)
-		print('found in title:', str(len(tfound))+'/'+str(len(twords))+',', end=" ")
-		swords=towords(subtitle,art_lang[-2:])
-		sfound=jcode_ha(swords,art_dict,date,art_lang[-2:],adjacent)
-		print('in sub:', str(len(sfound))+'/'+str(len(swords))+',', end=" ")
-		awords=towords(text,art_lang[-2:])
-		afound=jcode_ha(awords,art_dict,date,art_lang[-2:],adjacent)
-		print('in text:', str(len(afound))+'/'+str(len(awords))+'.')
+	if total:
+		print(str(round(progress*100/total,1))+'%', id, art_lang, end=" ")
 	else:
-		twords=towords(title,art_lang[-2:])
-		tfound=jcode(twords,art_dict,date,adjacent)
-		print('found in title:', str(len(tfound))+'/'+str(len(twords))+',', end=" ")
-		swords=towords(subtitle,art_lang[-2:])
-		sfound=jcode(swords,art_dict,date,adjacent)
-		print('in sub:', str(len(sfound))+'/'+str(len(swords))+',', end=" ")
-		awords=towords(text,art_lang[-2:])
-		afound=jcode(awords,art_dict,date,adjacent)
-		print('in text:', str(len(afound))+'/'+str(len(awords))+'.')
-
-	#EXPORT AS RESULTS LIST
-	for f in range(len(tfound)):
-		rl.write(str(id)+',t'+str(tfound[f][0])+','+tfound[f][1]+'\n')
-	for f in range(len(sfound)):
-		rl.write(str(id)+',s'+str(sfound[f][0])+','+sfound[f][1]+'\n')
-	for f in range(len(afound)):
-		rl.write(str(id)+',a'+str(afound[f][0])+','+afound[f][1]+'\n')
-	
-	#EXPORT AS ANNOTATED ARTICLES
-	if annotation==1:
-		ea.write(str(id)+'\t')
-		ea.write(e_annotate(twords,tfound,dc)+'\t')
-		ea.write(e_annotate(swords,sfound,dc)+'\n')
-		ea.write(e_annotate(awords,afound,dc)+'\n\n')
+		print(progress, id, art_lang, end=" ")
+	stats=[]
+	for k in range(len(sets)):
+		twords,tfound,swords,sfound,awords,afound=codings[k][:6]
+		count='found in title: '+str(len(tfound))+'/'+str(len(twords))+', in sub: '+str(len(sfound))+'/'+str(len(swords))+', in text: '+str(len(afound))+'/'+str(len(awords))+'.'
+		if len(sets)>1:
+			count=sets[k]['name']+' '+count
+		stats.append(count)
+	print(' '.join(stats))
 
-	#EXPORT AS REPLACED TEXTS CONTAINING ONLY THE RECOGNIZED CONCEPT IDS
-	if replaced==1:
-		er.write(str(id)+'\t')
-		er.write(e_replace(tfound)+'\t')
-		er.write(e_replace(sfound)+'\t')
-		er.write(e_replace(afound)+'\n')
-		
-	#EXPORT AS KWIC
-	if kwics==1:
-		instances=[]
-		for item in dl:
-			instances.append([])
-
-		for tf in tfound:
-			kwic=e_kwic(tf,b,twords,dc)
-			instances[dl.index(tf[1])].append(kwic)
-		for sf in sfound:
-			kwic=e_kwic(sf,b,swords,dc)
-			instances[dl.index(sf[1])].append(kwic)
-		for af in afound:
-			kwic=e_kwic(af,b,awords,dc)
-			instances[dl.index(af[1])].append(kwic)
-		for i in range(len(instances)):
-			if instances[i]==[]:
-				kw.write(dl[i]+','+dc[dl[i]]+',,,\n')
+	ids.write(str(id)+'\n')
+
+	for k in range(len(sets)):
+		s=sets[k]
+		dc,dl,col=s['dc'],s['dl'],s['col']
+		twords,tfound,swords,sfound,awords,afound=codings[k][:6]
+		tspans,sspans,aspans=None,None,None
+		if original==1:
+			tspans,sspans,aspans=codings[k][6:]
+
+		#EXPORT AS RESULTS LIST
+		for f in range(len(tfound)):
+			s['rl'].write(str(id)+',t'+str(tfound[f][0])+','+tfound[f][1]+'\n')
+		for f in range(len(sfound)):
+			s['rl'].write(str(id)+',s'+str(sfound[f][0])+','+sfound[f][1]+'\n')
+		for f in range(len(afound)):
+			s['rl'].write(str(id)+',a'+str(afound[f][0])+','+afound[f][1]+'\n')
+
+		#EXPORT AS ANNOTATED ARTICLES
+		if annotation==1:
+			s['ea'].write(str(id)+'\t')
+			s['ea'].write(e_annotate(twords,tfound,dc,title,tspans)+'\t')
+			s['ea'].write(e_annotate(swords,sfound,dc,subtitle,sspans)+'\n')
+			s['ea'].write(e_annotate(awords,afound,dc,text,aspans)+'\n\n')
+
+		#EXPORT AS REPLACED TEXTS CONTAINING ONLY THE RECOGNIZED CONCEPT IDS
+		if replaced==1:
+			s['er'].write(str(id)+'\t')
+			s['er'].write(e_replace(tfound)+'\t')
+			s['er'].write(e_replace(sfound)+'\t')
+			s['er'].write(e_replace(afound)+'\n')
+
+		#EXPORT AS COOCCURRENCES
+		if cooc==1:
+			items=[]
+			for tf in tfound:
+				items.append(['t'+str(tf[0]),tf[1]])
+			for sf in sfound:
+				items.append(['s'+str(sf[0]),sf[1]])
+			for af in afound:
+				items.append(['a'+str(af[0]),af[1]])
+			for pair,weight in cooccurrences(items,window).items():
+				s['co'].write(str(id)+','+pair[0]+','+pair[1]+',%.3f\n' % weight)
+
+		#EXPORT AS KWIC
+		if kwics==1:
+			instances=[]
+			for item in dl:
+				instances.append([])
+
+			for tf in tfound:
+				kwic=e_kwic(tf,b,twords,dc,title,tspans)
+				instances[col[tf[1]]].append(kwic)
+			for sf in sfound:
+				kwic=e_kwic(sf,b,swords,dc,subtitle,sspans)
+				instances[col[sf[1]]].append(kwic)
+			for af in afound:
+				kwic=e_kwic(af,b,awords,dc,text,aspans)
+				instances[col[af[1]]].append(kwic)
+			for i in range(len(instances)):
+				if instances[i]==[]:
+					s['kl'].write(dl[i]+','+dc[dl[i]]+',,,\n')
+				else:
+					for inst in instances[i]:
+						s['kl'].write(inst[0]+','+inst[1]+','+inst[2]+','+inst[3]+','+inst[4]+'\n')
+
+		#EXPORT AS TD MATRIX
+		if simpletd==1 or elaboratetd==1 or sparsetd==1:
+			counts={}
+			for f in tfound+sfound+afound:
+				counts[col[f[1]]]=counts.get(col[f[1]],0)+1
+			if sparsetd==1:
+				s['tdrows']=s['tdrows']+1
+				for c in sorted(counts):
+					s['td'].write(str(s['tdrows'])+' '+str(c+1)+' '+str(counts[c])+'\n')
+				s['tdentries']=s['tdentries']+len(counts)
+				if elaboratetd==1:
+					s['tr'].write(str(id)+','+medium.replace(',',' ')+','+date+'\n')
+				else:
+					s['tr'].write(str(id)+'\n')
 			else:
-				for inst in instances[i]:
-					kw.write(inst[0]+','+inst[1]+','+inst[2]+','+inst[3]+','+inst[4]+'\n')
-		
-	#EXPORT AS TD MATRIX
-	if simpletd==1 or elaboratetd==1:
-		vector=[]
-		for item in dl:
-			vector.append(0)
-		for tf in tfound:
-			vector[dl.index(tf[1])]=vector[dl.index(tf[1])]+1
-		for sf in sfound:
-			vector[dl.index(sf[1])]=vector[dl.index(sf[1])]+1
-		for af in afound:
-			vector[dl.index(af[1])]=vector[dl.index(af[1])]+1
-		if simpletd==1:
-			tdline=str(id)+','
-			for v in vector:
-				tdline=tdline+str(v)+','
-			td.write(tdline[:-1]+'\n')
-		if elaboratetd==1:
-			tdline=str(id)+','+medium.replace(',',' ')+','+date+','
-			for v in vector:
-				tdline=tdline+str(v)+','
-			td.write(tdline[:-1]+'\n')
-
-rl.close()
-if annotation==1:
-	ea.close()
-if replaced==1:
-	er.close()
-if kwics==1:
-	kw.close()
-	kwi=codecs.open('kwic_'+index+'_'+str(dictionary)+'.txt',encoding='utf-8')
-	kwis=[]
-	for line in kwi:
-		kwis.append(line.strip())
-	kwi.close()
-	kwis.sort()
-	kwo=codecs.open('kwic_'+index+'_'+str(dictionary)+'.txt','w',encoding='utf-8')
-	for line in kwis:
-		kwo.write(line+'\n')
-	kwo.close()
-if simpletd==1 or elaboratetd==1:
-	td.close()
\ No newline at end of file
+				vector=[0]*len(dl)
+				for c in counts:
+					vector[c]=counts[c]
+				if simpletd==1:
+					tdline=[str(id)]
+				if elaboratetd==1:
+					tdline=[str(id),medium.replace(',',' '),date]
+				s['td'].write(','.join(tdline+[str(v) for v in vector])+'\n')
+
+	if progress%checkpoint==0:
+		record(id,progress)
+
+record(id,progress)
+if tokencache==1:
+	for lang in caches:
+		closetokencache(caches[lang])
+if profiling==1:
+	profilereport(profiles,dicts,languages,'profile_'+index+'_'+run+'.txt')
+for s in sets:
+	if sparsetd==1:
+		s['td'].seek(tdsize)
+		s['td'].write(str(s['tdrows'])+' '+str(len(s['dl']))+' '+str(s['tdentries']))
+for filename,f in outputs:
+	f.close()
+for s in sets:
+	if kwics==1:
+		kw=sortruns(s['kwicfile'])
+		if coded>0:	# the sorted lines of the earlier runs are merged with the new ones
+			if not os.path.exists(s['kwicfile']+'.old'):
+				os.replace(s['kwicfile'],s['kwicfile']+'.old')
+			kw[3].append(s['kwicfile']+'.old')
+		for line in open(s['kwicfile']+'.lines',encoding='utf-8',newline='\n'):
+			addline(kw,line)
+		mergeruns(kw,s['kwicfile'])
+os.replace(journalfile,manifestfile)
+for s in sets:
+	if kwics==1:
+		os.remove(s['kwicfile']+'.lines')